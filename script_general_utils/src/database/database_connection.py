@@ -20,39 +20,352 @@ License:     Although this application has been produced and tested
  be held liable for improper or incorrect use of the utility described and/
  or contained herein.
 ****************************************************************************"""
+import re
+import time
+import itertools
+import collections
+import weakref
+import threading
+import contextlib
+from multiprocessing.pool import ThreadPool
 import psycopg2 
+import psycopg2.pool
+import psycopg2.extensions
+
+_pools = {} # Shared connection pools keyed by connection parameters
+_pools_lock = threading.Lock()
+_cursor_names = itertools.count() # Unique names for server side cursors
+_statement_names = itertools.count() # Unique names for prepared statements
+_prepared = weakref.WeakKeyDictionary() # Prepared statements (SQL: name) per connection
+
+
+class Connection_Pool (object):
+    """Thread safe pool of open database connections. Connections are checked 
+    out, used and checked back in so the cost of opening a connection (TCP and
+    authentication) is only paid once per connection rather then per operation.
+    A connection that has been idle for more then 'check_after' seconds is 
+    tested before it is handed out and replaced if it has gone bad."""
+    
+    def __init__ (self, host, database, user, password, minconn = 1, maxconn = 10, check_after = 30, timeout = 60):
+        """Constructor: opens 'minconn' connections to the database. No more then
+        'maxconn' connections are ever open, checkout waits up to 'timeout' seconds
+        (None to wait forever) for one to be returned."""
+        dsn = " host='%s' dbname='%s' user='%s' password='%s'" %(host, database, user, password)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._available = threading.Condition() # Signalled when a connection is checked in
+        self._checked_out = 0
+        self._maxconn = maxconn
+        self._check_after = check_after
+        self._timeout = timeout
+        self._last_used = {} # Time each connection was checked in (by id)
+        
+        
+    def checkout (self, timeout = None):
+        """Returns an open, healthy connection from the pool. Waits if all 
+        connections are checked out, raising psycopg2.pool.PoolError if none is
+        returned within 'timeout' seconds (the pool's timeout if not given)."""
+        if timeout is None: timeout = self._timeout
+        if timeout is not None: deadline = time.time() + timeout
+        with self._available:
+            while self._checked_out >= self._maxconn:
+                if timeout is None: 
+                    self._available.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0: 
+                    raise psycopg2.pool.PoolError('No connection was returned to the pool within %s seconds' %(timeout))
+                self._available.wait(remaining)
+            self._checked_out += 1
+        try:
+            for _ in range (0, self._maxconn + 1): # Replace bad connections
+                connection = self._pool.getconn()
+                if self.check(connection): return connection
+                self._last_used.pop(id(connection), None)
+                self._pool.putconn(connection, close = True)
+            raise psycopg2.OperationalError('Could not get a healthy connection from the pool')
+        except:
+            self._release()
+            raise
+        
+        
+    def checkin (self, connection, close = False):
+        """Returns a connection to the pool. Any open transaction is rolled back.
+        Closed or broken connections are discarded rather then reused."""
+        try:
+            if connection.closed: close = True
+            elif connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try: connection.rollback()
+                except psycopg2.Error: close = True
+            if close: self._last_used.pop(id(connection), None)
+            else: self._last_used[id(connection)] = time.time()
+            self._pool.putconn(connection, close = close)
+        finally:
+            self._release()
+            
+            
+    def _release (self):
+        """Free a checked out slot and wake a waiting checkout."""
+        with self._available:
+            self._checked_out -= 1
+            self._available.notify()
+            
+            
+    def check (self, connection):
+        """Health check: returns True if the connection is usable. Connections 
+        used recently are trusted, others are tested with a simple query."""
+        if connection.closed: return False
+        if time.time() - self._last_used.get(id(connection), 0) < self._check_after: return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+            connection.rollback()
+            return True
+        except psycopg2.Error: 
+            return False
+        
+        
+    @contextlib.contextmanager
+    def connection (self):
+        """Checks out a connection for use in a 'with' statement and returns it 
+        to the pool when the block ends."""
+        connection = self.checkout()
+        try: yield connection
+        finally: self.checkin(connection)
+        
+        
+    def close (self):
+        """Close every connection in the pool."""
+        self._pool.closeall()
+        
+        
+        
+def get_pool (host, database, user, password, minconn = 1, maxconn = 10, timeout = 60):
+    """Returns the shared Connection_Pool for the given connection parameters,
+    creating it if it does not exist yet. Pool sizes and the checkout timeout 
+    only apply on creation."""
+    key = (host, database, user, password)
+    with _pools_lock:
+        if key not in _pools: 
+            _pools[key] = Connection_Pool(host, database, user, password, minconn, maxconn, timeout = timeout)
+        return _pools[key]
+    
+    
+def close_pools ():
+    """Close all shared connection pools."""
+    with _pools_lock:
+        for pool in _pools.values(): pool.close()
+        _pools.clear()
+        
+
+
+class Query_Cache (object):
+    """Least recently used cache of query results. Entries are keyed by the
+    normalized SQL and its parameters, expire after 'ttl' seconds (None to never
+    expire) and are dropped once a write to a table they read from is committed
+    or rolled back. A cache can be shared by several connections, in which case
+    a write made by any of them invalidates the cached results for that table."""
+    
+    def __init__ (self, max_entries = 256, ttl = 60):
+        """Constructor: sets the size bound and time to live of entries."""
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = collections.OrderedDict() # key: (expires, rows, tables). Oldest first
+        self._tables = {} # table: set of keys that read from it
+        self._generation = 0 # Changed by every invalidation
+        self._lock = threading.Lock()
+        self._statistics = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        
+        
+    def get (self, key):
+        """Returns (True, rows) if the key is cached and has not expired, 
+        otherwise (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.time(): 
+                self._remove(key) # Expired
+                entry = None
+            if entry is None: 
+                self._statistics['misses'] += 1
+                return False, None
+            self._entries[key] = self._entries.pop(key) # Mark as most recently used
+            self._statistics['hits'] += 1
+            return True, entry[1]
+        
+        
+    def generation (self):
+        """Returns a counter that changes whenever results are invalidated. Read it
+        before running a query and pass it to 'put'."""
+        with self._lock: return self._generation
+    
+    
+    def put (self, key, rows, tables, generation = None):
+        """Cache the rows for a key along with the tables they were read from. If
+        'generation' is given and results have been invalidated since it was read
+        the rows may be stale (another connection committed while they were being
+        read) and are not cached."""
+        with self._lock:
+            if generation is not None and generation <> self._generation: return
+            self._remove(key)
+            if self._ttl is None: expires = None
+            else: expires = time.time() + self._ttl
+            self._entries[key] = (expires, rows, tables)
+            for table in tables: self._tables.setdefault(table, set()).add(key)
+            while len(self._entries) > self._max_entries: # Drop least recently used
+                self._remove(next(iter(self._entries)))
+                self._statistics['evictions'] += 1
+                
+                
+    def invalidate (self, table = None):
+        """Drop all cached results that read from the table, or everything if no
+        table is given."""
+        with self._lock:
+            if table is None: keys = list(self._entries.keys())
+            else: keys = list(self._tables.get(_table_name(table), ()))
+            for key in keys: self._remove(key)
+            self._statistics['invalidations'] += len(keys)
+            self._generation += 1
+            
+            
+    def get_statistics (self):
+        """Returns a dictionary of hit, miss, eviction and invalidation counts and
+        the number of cached entries."""
+        with self._lock:
+            statistics = dict(self._statistics)
+            statistics['entries'] = len(self._entries)
+            return statistics
+        
+        
+    def _remove (self, key):
+        """Remove an entry and its table references (lock must be held)."""
+        entry = self._entries.pop(key, None)
+        if entry is None: return
+        for table in entry[2]:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys: del self._tables[table]
+
+
 
 class Database_Connection (object):
     
-    def __init__ (self, host , database, user, password):
+    def __init__ (self, host , database, user, password, pool = None, cache = None):
         """Constructor: sets up an initial connection to a database given the 
-        host server and database name."""
+        host server and database name. The connection is drawn from 'pool' or, 
+        if not given, the shared pool for these connection parameters. Pass a 
+        Query_Cache as 'cache' to cache the results of read queries."""
         self._host = host
         self._database = database
         self._user = user
         self._password = password
+        if pool is None: pool = get_pool(host, database, user, password)
+        self._pool = pool
+        self._cache = cache
+        self._transaction_depth = 0 # Number of open 'transaction' blocks
+        self._written = set() # Tables written since the last commit or rollback
 
         connection, cursor = self.connect()
         self._connection = connection
         self._cursor = cursor
+        
+        
+    def __enter__ (self):
+        """Allows the connection to be used in a 'with' statement."""
+        return self
+    
+    
+    def __exit__ (self, exc_type, exc_value, traceback):
+        """Return the connection to the pool when leaving a 'with' statement."""
+        self.close()
+        return False
+    
+    
+    def __del__ (self):
+        """Return the connection to the pool if 'close' was never called, so an
+        abandoned instance does not hold a pool slot."""
+        if getattr(self, '_connection', None) is None: return
+        try: self.close()
+        except Exception: pass
 
     
     def connect (self):
-        """Connect creates new database session and returns connection and cursor 
-        object object. This method is called on instantiation of the class but is left
-        as a separate function so that it could be manually called again later if needed."""
-        connection  = psycopg2.connect(" host='%s' dbname='%s' user='%s' password='%s'" %(self._host, self._database, self._user, self._password))
+        """Connect checks out a database session from the connection pool and returns
+        connection and cursor object object. This method is called on instantiation of
+        the class but is left as a separate function so that it could be manually called
+        again later if needed, the current session is then returned to the pool first."""
+        if getattr(self, '_connection', None) is not None:
+            if self._transaction_depth > 0: raise psycopg2.ProgrammingError('connect can not be used inside a transaction block')
+            self.close() # Uncommitted work is rolled back
+        connection = self._pool.checkout()
         cursor = connection.cursor() # Cursor object
+        self._connection, self._cursor = connection, cursor
         return connection, cursor
     
     
     def execute (self, sql):
-        """Execute a SQL queary on the current dataset """
+        """Execute a SQL queary on the current dataset. SELECT queries are served
+        from the result cache if there is one, other statements invalidate the 
+        cached results of the tables they name when they are committed."""
+        if self._cache is not None and re.match(r'\s*(select|with)\b', sql, re.IGNORECASE): 
+            return self._cached(sql, None, lambda: self._fetch(sql))
         self._cursor.execute("""%s""" %(sql))
+        for table in _tables_named(sql): self._invalidate(table)
+        if self._connection.autocommit: self._finish(True) # Already committed
         try:
             return self._cursor.fetchall() # Get data resulting from the SQL statement
         except:
             return False # If no results returned
+        
+        
+    def _fetch (self, sql, params = None):
+        """Execute a query and return all rows."""
+        self._cursor.execute(sql, params)
+        return self._cursor.fetchall()
+    
+    
+    def _cached (self, sql, params, loader):
+        """Returns rows for a query from the result cache, calling loader() to 
+        run the query if it is not cached (or there is no cache). The cache is 
+        not used while there are uncommitted writes, which only this connection 
+        can see."""
+        if self._cache is None or self._written: return loader()
+        key = (' '.join(sql.split()).rstrip(';'), params)
+        hit, rows = self._cache.get(key)
+        if not hit:
+            generation = self._cache.generation()
+            rows = loader()
+            self._cache.put(key, rows, _tables_named(sql), generation)
+        return list(rows) # Copy so callers can not change the cached rows
+    
+    
+    def _invalidate (self, table):
+        """Note a table as written to. Its cached results are dropped when the 
+        write is committed or rolled back, see '_finish'."""
+        if self._cache is not None: self._written.add(table)
+        
+        
+    def _finish (self, commit):
+        """Commit (or roll back) the current transaction then drop the cached
+        results of every table written in it. Dropping them after the commit 
+        means another connection sharing the cache can not cache the old rows 
+        in between."""
+        try:
+            if commit: self._connection.commit()
+            else: self._connection.rollback()
+        finally: self._drop_written()
+            
+            
+    def _drop_written (self):
+        """Drop the cached results of the tables written since the last commit or
+        rollback."""
+        written, self._written = self._written, set()
+        for table in written: self._cache.invalidate(table)
+        
+        
+    def get_cache (self):
+        """Returns the Query_Cache or None if results are not cached."""
+        return self._cache
             
         
         
@@ -61,13 +374,15 @@ class Database_Connection (object):
         the table, other then the primary key, and should be specified as a string of 
         SQL. For example: "name type NOT NULL, name type,..."""
         self._cursor.execute("CREATE TABLE %s (%s serial NOT NULL, %s, CONSTRAINT %s PRIMARY KEY (%s));" %(table, pkey, columns, table + pkey, pkey))
-        self._connection.commit()
+        self._invalidate(table)
+        self._commit()
         
         
     def copy_table (self, table):
         """Copies a tables header information to a new table"""
         self._cursor.execute("CREATE TABLE processing_table (LIKE %s INCLUDING ALL);" %(table))
-        self._connection.commit()
+        self._invalidate('processing_table')
+        self._commit()
         
     
     def insert_record (self, table, value_map):
@@ -79,7 +394,111 @@ class Database_Connection (object):
         values = [str(value) for value in value_map.values() if value <> '']
         
         self._cursor.execute("INSERT INTO %s (%s) VALUES (%s);" %(table, ', '.join(fields), ', '.join(values)))
-        self._connection.commit()
+        self._invalidate(table)
+        self._commit()
+        
+        
+    def insert_records (self, table, records, fields = None, batch_size = 1000, commit_every = None):
+        """Insert many records into the given table using multi-row INSERT statements
+        of up to 'batch_size' rows. Records can be value maps (dictionaries) as used 
+        by 'insert_record', with strings already quoted and '' for the column default,
+        or tuples of plain python values in the order of 'fields' which are quoted 
+        by psycopg2. If fields is not given the keys of the first value map are used,
+        or for tuples every column of the table in order. Changes are committed every 'commit_every' rows (if given) and at the end.
+        Only one batch is held in memory at a time. Returns a dictionary with the
+        number of 'rows' inserted, the 'seconds' taken and 'rows_per_second'."""
+        start = time.time()
+        inserted, uncommitted = 0, 0
+        batch = list()
+        
+        for record in records:
+            if fields is None and isinstance(record, dict): fields = list(record.keys())
+            batch.append(self._format_row(record, fields))
+            
+            if len(batch) >= batch_size: 
+                self._insert_batch(table, fields, batch)
+                inserted += len(batch)
+                uncommitted += len(batch)
+                batch = list()
+                if commit_every and uncommitted >= commit_every:
+                    self._commit()
+                    uncommitted = 0
+            
+        if batch: 
+            self._insert_batch(table, fields, batch)
+            inserted += len(batch)
+        self._commit()
+        
+        seconds = time.time() - start
+        if seconds > 0: rate = inserted / seconds
+        else: rate = float(inserted)
+        return {'rows': inserted, 'seconds': seconds, 'rows_per_second': rate}
+    
+    
+    def _format_row (self, record, fields):
+        """Returns a record as a '(value, value, ...)' string for a VALUES list.
+        Value maps hold quoted strings ('' is the column default), tuples hold 
+        plain python values which are quoted by psycopg2."""
+        if isinstance(record, dict): # Value map of quoted strings
+            values = [record.get(field, '') for field in fields]
+            return '(%s)' %(', '.join([str(value) if value <> '' else 'DEFAULT' for value in values]))
+        return self._cursor.mogrify('(%s)' %(', '.join(['%s'] * len(record))), tuple(record))
+    
+    
+    def _insert_batch (self, table, fields, rows):
+        """Insert a list of already formatted '(value, value, ...)' rows with a single
+        multi-row INSERT statement. Without fields rows hold every column in order."""
+        if fields is None: columns = ''
+        else: columns = ' (%s)' %(', '.join(fields))
+        self._cursor.execute("INSERT INTO %s%s VALUES %s;" %(table, columns, ', '.join(rows)))
+        self._invalidate(table)
+        
+        
+    def copy_from_rows (self, table, rows, fields = None):
+        """Load rows (tuples of plain python values, None for NULL) into a table
+        using the COPY protocol. Rows are formatted as they are read by the server
+        so a generator can be used and nothing is written to disk. 'fields' are 
+        the table columns in row order, all columns are used if not given."""
+        encoding = psycopg2.extensions.encodings[self._connection.encoding]
+        self._copy_in(table, fields, (_csv_line(row, encoding) for row in rows), False)
+        
+        
+    def copy_from_csv (self, table, csv_file, fields = None, header = True, trailing_comma = False):
+        """Load a csv file into a table using the COPY protocol. Set trailing_comma
+        to True for files written by output_file_csv (with a comma ending each
+        line) so it is removed, plain csv files are passed on untouched. Set
+        header to False if the file has no header line."""
+        with open(csv_file, 'r') as lines:
+            if trailing_comma: lines = (_strip_trailing_comma(line) for line in lines)
+            self._copy_in(table, fields, lines, header)
+            
+            
+    def copy_to_csv (self, source, output, csv_name = 'csv', headers = None):
+        """Export a table, or a SELECT query, straight to a csv file in the 
+        output_file_csv format (header and every value followed by a comma) using
+        the COPY protocol so rows are never held in python. The header defaults to
+        the column names. Returns the csv path and name."""
+        if len(source.split()) > 1: source = '(%s)' %(source.strip().rstrip(';')) # Query
+        if headers is None:
+            self._cursor.execute("SELECT * FROM %s AS source LIMIT 0;" %(source))
+            headers = [column[0] for column in self._cursor.description]
+            
+        csvfile = output + '\\' + csv_name + '.csv'
+        with open(csvfile, 'w') as output_file:
+            for item in headers: output_file.write(item + ',') # Print the header
+            output_file.write('\n') # Move cursor to next line
+            self._cursor.copy_expert("COPY %s TO STDOUT WITH CSV;" %(source), _Comma_Writer(output_file))
+        return csvfile
+    
+    
+    def _copy_in (self, table, fields, lines, header):
+        """Stream csv lines into a table with COPY ... FROM STDIN and commit."""
+        if fields: table = '%s (%s)' %(table, ', '.join(fields))
+        if header: options = 'CSV HEADER'
+        else: options = 'CSV'
+        self._cursor.copy_expert("COPY %s FROM STDIN WITH %s;" %(table, options), _Line_Reader(lines))
+        self._invalidate(table.split(' ')[0])
+        self._commit()
         
         
     def update_record (self, table, value_map, where):
@@ -91,7 +510,8 @@ class Database_Connection (object):
         for key, value in value_map.iteritems(): 
             if value <> '': set_values += "%s = %s," %(key, value)
         self._cursor.execute("UPDATE %s SET %s WHERE %s;" %(table, set_values [0:-1], where))
-        self._connection.commit()
+        self._invalidate(table)
+        self._commit()
         
         
     def upsert_record (self, table, join_tuple, value_map):
@@ -103,7 +523,7 @@ class Database_Connection (object):
         table. NOTE ('field') is not a tuple but a string in parentheses ('field',) is a tuple"""
         # Generate a where clause and select all rows with those values
         where = [field + ' = ' + str(value_map[field]) for field in join_tuple if value_map[field] <> '']
-        exists = self.get_selection(table, ' AND '.join(where))
+        exists = self._fetch("SELECT * FROM %s WHERE %s;" %(table, ' AND '.join(where))) # Not cached, decides the write
          
         if   len(exists) == 0: # If no records are selected: INSERT row
             self.insert_record(table, value_map)
@@ -112,6 +532,157 @@ class Database_Connection (object):
             self.update_record(table, value_map, ' AND '.join(where))
             return None
         else: return exists # If multiple records are selected return the rows
+        
+        
+    def upsert_records (self, table, join_tuple, records, fields = None, batch_size = 1000):
+        """Upsert many records using INSERT ... ON CONFLICT (join_tuple) DO UPDATE so
+        each batch of up to 'batch_size' records is a single statement. Records are
+        value maps or tuples as in 'insert_records'. As in 'upsert_record' fields 
+        left '' in a value map are not changed on existing rows (new rows get the
+        column default), so records are batched by the fields they give. If the 
+        same join values appear more then once in a batch the last record is used.
+        Returns a dictionary of 'inserted' and 'updated' lists holding the join 
+        values of each row as read back from the table; records that match an 
+        existing row but have nothing to change are listed as updated. This needs
+        a unique constraint (or index) on the join_tuple fields, if there is none
+        each record is upserted the way 'upsert_record' does it and records 
+        matching many rows are listed under 'skipped'."""
+        result = {'inserted': [], 'updated': [], 'skipped': []}
+        records = iter(records)
+        if fields is None: # Take the fields from the first value map
+            first = next(records, None)
+            if first is None: return result
+            fields = list(first.keys())
+            records = itertools.chain([first], records)
+        
+        if not self.has_unique_constraint(table, join_tuple):
+            for record in records: self._upsert_fallback(table, join_tuple, record, fields, result)
+            return result
+        
+        positions = [list(fields).index(field) for field in join_tuple]
+        groups = {} # Fields given: (join values: formatted row, join values in order)
+        pending = {} # Join values: fields given by the group holding them
+        for record in records:
+            if isinstance(record, dict): 
+                key = tuple([record.get(field) for field in join_tuple])
+                given = tuple([field for field in fields if record.get(field, '') <> ''])
+            else: key, given = tuple([record[position] for position in positions]), tuple(fields)
+            if pending.get(key, given) <> given: # Run the earlier record first so it does not undo this one
+                self._upsert_group(table, join_tuple, pending[key], groups, pending, result)
+            
+            batch, order = groups.setdefault(given, ({}, list()))
+            if key not in batch: order.append(key)
+            batch[key] = self._format_row(record, given) # Later rows replace earlier ones
+            pending[key] = given
+            if len(order) >= batch_size: self._upsert_group(table, join_tuple, given, groups, pending, result)
+        for given in list(groups.keys()): self._upsert_group(table, join_tuple, given, groups, pending, result)
+        self._invalidate(table)
+        self._commit()
+        return result
+    
+    
+    def execute_prepared (self, sql, values = ()):
+        """Execute a parameterized SQL statement using $1, $2... placeholders for
+        'values', which are plain python values quoted by psycopg2. Each statement
+        is prepared on the server once per connection so repeated calls skip 
+        parsing and planning. Returns the resulting rows or None."""
+        statements = _prepared.setdefault(self._connection, {})
+        name = statements.get(sql)
+        if name is None: # First use on this connection
+            name = 'prepared_%s' %(next(_statement_names))
+            self._cursor.execute("PREPARE %s AS %s" %(name, sql))
+            statements[sql] = name
+            
+        if values: self._cursor.execute("EXECUTE %s (%s);" %(name, ', '.join(['%s'] * len(values))), tuple(values))
+        else: self._cursor.execute("EXECUTE %s;" %(name))
+        if self._cursor.description is None: return None # No results
+        return self._cursor.fetchall()
+    
+    
+    def insert_values (self, table, values):
+        """Insert a record from a dictionary of field: plain python value. Unlike
+        'insert_record' values are not quoted by hand. The statement is prepared 
+        once for each table and set of fields."""
+        fields = sorted(values.keys())
+        self.execute_prepared("INSERT INTO %s (%s) VALUES (%s)" %(table, ', '.join(fields), _placeholders(len(fields))), 
+                              [values[field] for field in fields])
+        self._invalidate(table)
+        self._commit()
+        
+        
+    def update_values (self, table, values, where):
+        """Update records from a dictionary of field: plain python value where all
+        of the fields in the 'where' dictionary equal their values. The statement 
+        is prepared once for each table and set of fields."""
+        fields, keys = sorted(values.keys()), sorted(where.keys())
+        sets = ['%s = $%s' %(field, number) for number, field in enumerate(fields, 1)]
+        conditions = ['%s = $%s' %(key, number) for number, key in enumerate(keys, len(fields) + 1)]
+        self.execute_prepared("UPDATE %s SET %s WHERE %s" %(table, ', '.join(sets), ' AND '.join(conditions)), 
+                              [values[field] for field in fields] + [where[key] for key in keys])
+        self._invalidate(table)
+        self._commit()
+        
+        
+    def select_values (self, table, where):
+        """Get all records from a given table where all of the fields in the 'where'
+        dictionary equal their plain python values. The statement is prepared once
+        for each table and set of fields."""
+        keys = sorted(where.keys())
+        conditions = ['%s = $%s' %(key, number) for number, key in enumerate(keys, 1)]
+        sql = "SELECT * FROM %s WHERE %s" %(table, ' AND '.join(conditions))
+        values = [where[key] for key in keys]
+        return self._cached(sql, tuple(values), lambda: self.execute_prepared(sql, values))
+    
+    
+    def has_unique_constraint (self, table, fields):
+        """Returns True if the table has a unique constraint or index covering 
+        exactly the given fields (needed for ON CONFLICT). Partial and expression
+        indexes are not counted since ON CONFLICT (fields) can not use them."""
+        self._cursor.execute("""SELECT array_agg(a.attname::text) FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND i.indisunique AND i.indpred IS NULL AND NOT (0 = ANY(i.indkey))
+            GROUP BY i.indexrelid;""", (table,))
+        wanted = set([field.lower() for field in fields])
+        return any(set(columns) == wanted for (columns,) in self._cursor.fetchall())
+    
+    
+    def _upsert_group (self, table, join_tuple, fields, groups, pending, result):
+        """Upsert the batch of records giving 'fields' with one multi-row statement
+        and sort the returned join values into inserted (xmax is 0 for new rows) 
+        and updated rows. Only the given fields are set on existing rows, if only
+        join fields are given one is set to itself so the row is still returned."""
+        batch, order = groups.pop(fields)
+        for key in order: del pending[key]
+        updates = [field for field in fields if field not in join_tuple] or [join_tuple[0]]
+        self._cursor.execute("INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s RETURNING (xmax = 0), %s;" 
+                             %(table, ', '.join(fields), ', '.join([batch[key] for key in order]), ', '.join(join_tuple), 
+                               ', '.join(['%s = EXCLUDED.%s' %(field, field) for field in updates]), ', '.join(join_tuple)))
+        for row in self._cursor.fetchall():
+            if row[0]: result['inserted'].append(row[1:])
+            else: result['updated'].append(row[1:])
+            
+            
+    def _upsert_fallback (self, table, join_tuple, record, fields, result):
+        """Upsert a single record the way 'upsert_record' does when there is no 
+        unique constraint to use with ON CONFLICT. Join values are read back from
+        the table so they match those listed by '_upsert_group'."""
+        if isinstance(record, dict): value_map = record
+        else: value_map = dict([(field, self._cursor.mogrify('%s', (value,))) for field, value in zip(fields, record)])
+        
+        # Same steps as upsert_record, keeping track of which was carried out
+        where = ' AND '.join([field + ' = ' + str(value_map[field]) for field in join_tuple if value_map[field] <> ''])
+        exists = self._fetch("SELECT %s FROM %s WHERE %s;" %(', '.join(join_tuple), table, where))
+        if len(exists) == 0: 
+            given = [field for field in value_map.keys() if value_map[field] <> '']
+            self._cursor.execute("INSERT INTO %s (%s) VALUES (%s) RETURNING %s;" %(table, ', '.join(given), 
+                                 ', '.join([str(value_map[field]) for field in given]), ', '.join(join_tuple)))
+            result['inserted'].append(self._cursor.fetchone())
+            self._invalidate(table)
+            self._commit()
+        elif len(exists) == 1:
+            self.update_record(table, value_map, where)
+            result['updated'].append(exists[0])
+        else: result['skipped'].append(exists[0]) # Join values of the first matching row
              
     
     def remove_duplicates (self, table):
@@ -120,30 +691,90 @@ class Database_Connection (object):
     
     
     def close (self):
-        """Close the connection to the database """
-        self._connection.close()
+        """Return the connection to the connection pool. Uncommitted work is
+        rolled back. Use 'close_pools' to close the connections themselves."""
+        if self._connection is None: return # Already returned
+        self._cursor.close()
+        try: self._pool.checkin(self._connection)
+        finally:
+            self._connection = None
+            self._drop_written() # Rolled back by checkin
+        
+        
+    def get_cursor (self):
+        """Returns the cursor object for running SQL directly."""
+        return self._cursor
+    
+    
+    def commit (self):
+        """Commit the current transaction."""
+        self._finish(True)
+        
+        
+    def _commit (self):
+        """Commit made by the write methods. Deferred while inside a 'transaction'
+        block so the block is committed once when it ends."""
+        if self._transaction_depth == 0: self._finish(True)
+        
+        
+    @contextlib.contextmanager
+    def transaction (self):
+        """Groups work into a single unit for use in a 'with' statement. Commits 
+        made by methods such as 'insert_record' are deferred until the block ends,
+        then everything is committed at once, or rolled back if an error is raised.
+        Nested blocks use savepoints so an error only undoes the inner block."""
+        depth = self._transaction_depth
+        if depth > 0: self._cursor.execute("SAVEPOINT transaction_%s;" %(depth))
+        self._transaction_depth += 1
+        try: 
+            yield self
+        except:
+            if depth > 0: self._cursor.execute("ROLLBACK TO SAVEPOINT transaction_%s;" %(depth))
+            else: self._finish(False)
+            raise
+        else:
+            if depth > 0: self._cursor.execute("RELEASE SAVEPOINT transaction_%s;" %(depth))
+            else: self._finish(True)
+        finally:
+            self._transaction_depth = depth
+            
+    batch = transaction # Alternate name, i.e. 'with database.batch():'
+    
+    
+    @contextlib.contextmanager
+    def autocommit (self):
+        """Runs each statement in its own transaction for use in a 'with' statement.
+        Suited to read only work where there is nothing to commit. Any open 
+        transaction is committed first. Named cursors ('iter_execute') need 
+        withhold=True in this mode."""
+        if self._transaction_depth > 0: raise psycopg2.ProgrammingError('autocommit can not be used inside a transaction block')
+        self._finish(True)
+        previous = self._connection.autocommit
+        self._connection.autocommit = True
+        try: yield self
+        finally: self._connection.autocommit = previous # Restore the previous mode
     
     
     def get_tables (self):
         """Get all tables in the database and return them as a list of tuples"""
-        self._cursor.execute("""SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'""")
-        return self._cursor.fetchall() # Get data resulting from the SQL statement
+        sql = """SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"""
+        return self._cached(sql, None, lambda: self._fetch(sql)) # Get data resulting from the SQL statement
     
     
     def get_records (self, table):
         """Get all records from a given table and returns them as a list of tuples.
         This method is useful for small tables by is likely not viable for large ones.
-        In this case a server side cursor should be setup (http://wiki.postgresql.org/wiki/Using_psycopg2_with_PostgreSQL)"""
-        self._cursor.execute("""SELECT * FROM %s""" %(table))
-        return self._cursor.fetchall() # Get data resulting from the SQL statement
+        In this case use 'iter_records' which uses a server side cursor."""
+        sql = """SELECT * FROM %s""" %(table)
+        return self._cached(sql, None, lambda: self._fetch(sql)) # Get data resulting from the SQL statement
     
     
     def get_selection (self, table, where):
         """ Get all records from a given table that satisfy a given where clause
         and returns them as a list of tuples. The where clause should be in the 
         form of "Field = Value AND Field = Value"...etc."""
-        self._cursor.execute("SELECT * FROM %s WHERE %s;" %(table, where))
-        return self._cursor.fetchall()
+        sql = "SELECT * FROM %s WHERE %s;" %(table, where)
+        return self._cached(sql, None, lambda: self._fetch(sql))
         
     
     def get_version (self):
@@ -152,6 +783,223 @@ class Database_Connection (object):
         return self._cursor.fetchall() # Get data resulting from the SQL statement
     
     
+    def iter_execute (self, sql, itersize = 2000, withhold = False):
+        """Execute a SQL query using a server side (named) cursor and return an 
+        iterator over the resulting rows. Rows are fetched 'itersize' at a time so
+        memory use stays flat for large results. The cursor is closed by a commit
+        unless withhold is True, which is needed if the rows are used to write to 
+        the database (i.e. 'update_record') while iterating."""
+        cursor = self._connection.cursor(name = 'stream_%s' %(next(_cursor_names)), withhold = withhold)
+        cursor.itersize = itersize # Rows fetched per round trip
+        try:
+            cursor.execute("""%s""" %(sql))
+            for row in cursor: yield row
+        finally:
+            cursor.close()
+            
+            
+    def iter_tables (self, itersize = 2000):
+        """Iterator version of 'get_tables'."""
+        return self.iter_execute("""SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'""", itersize)
+    
+    
+    def iter_records (self, table, itersize = 2000, withhold = False):
+        """Iterator version of 'get_records' for large tables. See 'iter_execute'."""
+        return self.iter_execute("""SELECT * FROM %s""" %(table), itersize, withhold)
+    
+    
+    def iter_selection (self, table, where, itersize = 2000, withhold = False):
+        """Iterator version of 'get_selection' for large selections. See 'iter_execute'."""
+        return self.iter_execute("SELECT * FROM %s WHERE %s;" %(table, where), itersize, withhold)
+    
+    
+class Concurrent_Database_Connection (object):
+    """Runs Database_Connection methods side by side so many independent queries 
+    can be in flight at once. Each call is run by a worker thread on its own 
+    connection from the pool and returns straight away with a result object;
+    call '.get()' on it to wait for and return the value the Database_Connection
+    method would have returned. Python 2 has no asyncio so threads are used,
+    psycopg2 releases the GIL while waiting on the server."""
+    
+    def __init__ (self, host, database, user, password, workers = 8, pool = None, cache = None):
+        """Constructor: starts 'workers' threads. Connections are drawn from 'pool'
+        or, if not given, the shared pool for these connection parameters. A 
+        Query_Cache given as 'cache' is shared by all of the workers."""
+        self._host = host
+        self._database = database
+        self._user = user
+        self._password = password
+        if pool is None: pool = get_pool(host, database, user, password, maxconn = workers)
+        self._pool = pool
+        self._cache = cache
+        self._workers = ThreadPool(workers)
+        
+        
+    def __enter__ (self):
+        """Allows the connection to be used in a 'with' statement."""
+        return self
+    
+    
+    def __exit__ (self, exc_type, exc_value, traceback):
+        """Close the connection when leaving a 'with' statement."""
+        self.close()
+        return False
+        
+        
+    def _run (self, method, *args):
+        """Run a Database_Connection method on a pooled connection (worker thread)."""
+        database = Database_Connection(self._host, self._database, self._user, self._password, self._pool, self._cache)
+        try: return getattr(database, method)(*args)
+        finally: database.close()
+        
+        
+    def _submit (self, method, *args):
+        """Queue a Database_Connection method and return its result object."""
+        return self._workers.apply_async(self._run, (method,) + args)
+    
+    
+    def execute (self, sql):
+        """Queue 'execute'. Returns a result object, see the class description."""
+        return self._submit('execute', sql)
+    
+    
+    def get_tables (self):
+        """Queue 'get_tables'. Returns a result object."""
+        return self._submit('get_tables')
+    
+    
+    def get_records (self, table):
+        """Queue 'get_records'. Returns a result object."""
+        return self._submit('get_records', table)
+    
+    
+    def get_selection (self, table, where):
+        """Queue 'get_selection'. Returns a result object."""
+        return self._submit('get_selection', table, where)
+    
+    
+    def insert_record (self, table, value_map):
+        """Queue 'insert_record'. Returns a result object."""
+        return self._submit('insert_record', table, value_map)
+    
+    
+    def update_record (self, table, value_map, where):
+        """Queue 'update_record'. Returns a result object."""
+        return self._submit('update_record', table, value_map, where)
+    
+    
+    def upsert_record (self, table, join_tuple, value_map):
+        """Queue 'upsert_record'. Returns a result object."""
+        return self._submit('upsert_record', table, join_tuple, value_map)
+    
+    
+    def close (self):
+        """Wait for queued work to finish and stop the worker threads."""
+        self._workers.close()
+        self._workers.join()
+        
+        
+
+class _Line_Reader (object):
+    """File like object that reads from an iterator of lines. Used to feed
+    COPY ... FROM STDIN without building the whole file in memory."""
+    
+    def __init__ (self, lines):
+        """Constructor: takes in an iterator of strings ending in a new line."""
+        self._lines = iter(lines)
+        self._buffer = ''
+        
+        
+    def read (self, size = -1):
+        """Returns up to 'size' characters (all remaining if size is negative)."""
+        while size < 0 or len(self._buffer) < size:
+            try: self._buffer += next(self._lines)
+            except StopIteration: break
+        if size < 0: size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+    
+    
+    def readline (self, size = -1):
+        """Returns the next line."""
+        if self._buffer: 
+            line, self._buffer = self._buffer, ''
+            return line
+        return next(self._lines, '')
+    
+    
+    
+class _Comma_Writer (object):
+    """File like object that adds a comma to the end of each record written by
+    COPY ... TO STDOUT to match the output_file_csv format. New lines inside
+    quoted values are left alone; whether a quote is open is carried between
+    writes since COPY may split a record across them."""
+    
+    def __init__ (self, output_file):
+        """Constructor: takes in an open file."""
+        self._file = output_file
+        self._quoted = False # Inside a quoted value
+        
+        
+    def write (self, data):
+        """Write data to the file adding a comma before each record ending new line."""
+        if not self._quoted and '"' not in data: # No quoted values, every new line ends a record
+            self._file.write(data.replace('\n', ',\n'))
+            return
+        pieces, start = list(), 0
+        for match in re.finditer('["\n]', data):
+            if match.group() == '"': self._quoted = not self._quoted # '""' toggles twice
+            elif not self._quoted:
+                pieces.append(data[start:match.start()] + ',')
+                start = match.start()
+        pieces.append(data[start:])
+        self._file.write(''.join(pieces))
+        
+        
+        
+def _table_name (table):
+    """Returns a table name without schema or quotes, in lower case, for matching
+    cached queries to the tables they read."""
+    return table.split('.')[-1].strip('"').lower()
+
+
+def _tables_named (sql):
+    """Returns the set of tables named in a SQL statement (after FROM, JOIN, INTO,
+    UPDATE or TABLE)."""
+    names = re.findall(r'\b(?:from|join|into|update|table)\s+(?:only\s+)?([\w."]+)', sql, re.IGNORECASE)
+    return set([_table_name(name) for name in names])
+
+
+def _placeholders (count):
+    """Returns '$1, $2, ...' placeholders for a prepared statement."""
+    return ', '.join(['$%s' %(number) for number in range (1, count + 1)])
+
+
+def _csv_line (row, encoding):
+    """Returns a row of python values as a csv line. None is written as an empty
+    (NULL) value and empty strings are quoted so they are kept as strings. Floats
+    are written in full (str keeps only 12 digits) and unicode is encoded with
+    the (python name of the) connection encoding."""
+    values = list()
+    for value in row:
+        if value is None: values.append('')
+        else:
+            if isinstance(value, float): value = repr(float(value))
+            elif isinstance(value, unicode): value = value.encode(encoding)
+            else: value = str(value)
+            if value == '' or any(character in value for character in ',"\r\n'):
+                value = '"%s"' %(value.replace('"', '""'))
+            values.append(value)
+    return ','.join(values) + '\n'
+
+
+def _strip_trailing_comma (line):
+    """Remove the comma output_file_csv writes at the end of each line."""
+    stripped = line.rstrip('\r\n')
+    if stripped.endswith(','): stripped = stripped[:-1]
+    return stripped + '\n'
+    
+    
 def driver ():
     pass
 if __name__ == '__main__':
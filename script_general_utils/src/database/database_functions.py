@@ -32,7 +32,8 @@ def database_spatialupdate (self, DBase, table, where, feature, xy_dict = {'X':
     selection = 'Selection'
     arcpy.MakeFeatureLayer_management (feature, selection)
 
-    points = DBase.get_selection(table , "%s" %(where))
+    # Stream the points, held open across the commits made by update_record
+    points = DBase.iter_selection(table , "%s" %(where), withhold = True)
     for point in points:
         X = point[xy_dict['X']]
         Y = point[xy_dict['Y']]
@@ -47,6 +48,73 @@ def database_spatialupdate (self, DBase, table, where, feature, xy_dict = {'X':
 
         DBase.update_record(table, {'name': "'" + name + "'"}, "x = %s AND y = %s" %(X, Y))
         
+
+
+
+def database_spatialupdate_set (DBase, table, where, feature, xy_fields = ('x', 'y'), name_field = 'name',
+                                batch_size = 5000, postgis_table = None, geometry_field = 'geom', srid = 3338):
+    """Set based version of 'database_spatialupdate'. The polygon features are read
+    once into an in memory spatial index (utilities.spatial_index), every point
+    selected by the where clause is located in a single pass and the names are
+    written back with one UPDATE ... FROM (VALUES ...) per 'batch_size' points.
+    Point X and Y values are read from the 'xy_fields' columns and are assumed to
+    be in the same projection as the features (Alaska Albers). Points outside
+    every polygon are named 'None'. If 'postgis_table' is given and PostGIS is 
+    installed the whole join is instead run on the server with ST_Within against 
+    that table's 'geometry_field'. Returns the number of table rows updated."""
+    x_field, y_field = xy_fields
+    if postgis_table and DBase.execute("SELECT 1 FROM pg_extension WHERE extname = 'postgis';"):
+        with DBase.transaction():
+            DBase.execute("""UPDATE %s AS points SET %s = COALESCE((SELECT polygons.%s FROM %s AS polygons 
+                WHERE ST_Within(ST_SetSRID(ST_MakePoint(points.%s, points.%s), %s), polygons.%s) LIMIT 1), 'None')
+                WHERE %s;""" %(table, name_field, name_field, postgis_table, x_field, y_field, srid, geometry_field, where))
+            return DBase.get_cursor().rowcount
+    
+    import numpy
+    import arcpy  # @UnresolvedImport
+    from utilities.spatial_index import Polygon_Index
+    
+    # Read polygon rings once. A None point separates interior rings in arcpy
+    polygons, names = list(), list()
+    rows = arcpy.SearchCursor(feature)
+    for row in rows:
+        rings = list()
+        for part in row.Shape:
+            ring = list()
+            for point in part:
+                if point is None: 
+                    rings.append(ring)
+                    ring = list()
+                else: ring.append((point.X, point.Y))
+            rings.append(ring)
+        rings = [numpy.array(ring, dtype = float) for ring in rings if len(ring) > 2]
+        if rings: 
+            polygons.append(rings)
+            names.append(row.getValue(name_field))
+    del rows
+    
+    # Locate every distinct point at once
+    points = DBase.execute("SELECT DISTINCT %s, %s FROM %s WHERE %s;" %(x_field, y_field, table, where))
+    if not points: return 0
+    xy = numpy.array(points, dtype = float)
+    located = Polygon_Index(polygons).locate(xy[:, 0], xy[:, 1])
+    
+    # Write names back in bulk, committed once at the end
+    cursor = DBase.get_cursor()
+    updated = 0
+    with DBase.transaction():
+        for start in range (0, len(points), batch_size):
+            values = list()
+            for (X, Y), polygon in zip(points[start:start + batch_size], located[start:start + batch_size]):
+                if polygon < 0: name = 'None'
+                else: name = names[polygon]
+                values.append(cursor.mogrify('(%s, %s, %s)', (X, Y, name)))
+            cursor.execute("""UPDATE %s AS points SET %s = located.located_name 
+                FROM (VALUES %s) AS located (located_x, located_y, located_name)
+                WHERE points.%s = located.located_x AND points.%s = located.located_y AND %s;""" 
+                %(table, name_field, ', '.join(values), x_field, y_field, where))
+            updated += cursor.rowcount # Rows sharing a point are all updated
+    return updated
             
             
 def driver ():
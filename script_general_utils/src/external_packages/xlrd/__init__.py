@@ -270,6 +270,10 @@ from . import licences
 # data and returns without releasing resources. At this stage, the only
 # information available about sheets is Book.nsheets and Book.sheet_names().</p>
 #
+# <p>on_demand=True and an Excel 2007+ (xlsx) file: open_workbook() loads the
+# workbook, styles and shared strings and returns with the ZIP file still open.
+# A sheet's XML is parsed only when the sheet is first requested.</p>
+#
 # <p>Book.sheet_by_name() and Book.sheet_by_index() will load the requested
 # sheet if it is not already loaded.</p>
 #
@@ -375,6 +379,10 @@ USE_MMAP = MMAP_AVAILABLE
 # Sheet.row_len() method.
 # <br /> -- New in version 0.7.2
 #
+# @param columnar True stores each sheet's cells by column in typed arrays (see the
+# ColumnarSheet class), using much less memory for numeric sheets and giving
+# zero-copy column arrays. Can not be combined with formatting_info.
+#
 # @return An instance of the Book class.
 
 def open_workbook(filename=None,
@@ -386,7 +394,10 @@ def open_workbook(filename=None,
     formatting_info=False,
     on_demand=False,
     ragged_rows=False,
+    columnar=False,
     ):
+    if columnar and formatting_info:
+        raise XLRDError('columnar=True can not be used with formatting_info=True')
     peeksz = 4
     if file_contents:
         peek = file_contents[:peeksz]
@@ -414,6 +425,7 @@ def open_workbook(filename=None,
                 formatting_info=formatting_info,
                 on_demand=on_demand,
                 ragged_rows=ragged_rows,
+                columnar=columnar,
                 )
             return bk
         if 'xl/workbook.bin' in component_names:
@@ -433,6 +445,7 @@ def open_workbook(filename=None,
         formatting_info=formatting_info,
         on_demand=on_demand,
         ragged_rows=ragged_rows,
+        columnar=columnar,
         )
     return bk
 
@@ -147,6 +147,7 @@ XL_CONDFMT = 0x01B0
 XL_CONTINUE = 0x3c
 XL_COUNTRY = 0x8C
 XL_DATEMODE = 0x22
+XL_DBCELL = 0xd7
 XL_DEFAULTROWHEIGHT = 0x0225
 XL_DEFCOLWIDTH = 0x55
 XL_DIMENSION = 0x200
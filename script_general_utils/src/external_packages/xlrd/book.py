@@ -70,6 +70,7 @@ def open_workbook_xls(filename=None,
     file_contents=None,
     encoding_override=None,
     formatting_info=False, on_demand=False, ragged_rows=False,
+    columnar=False,
     ):
     t0 = time.clock()
     if TOGGLE_GC:
@@ -85,6 +86,7 @@ def open_workbook_xls(filename=None,
             formatting_info=formatting_info,
             on_demand=on_demand,
             ragged_rows=ragged_rows,
+            columnar=columnar,
             )
         t1 = time.clock()
         bk.load_time_stage_1 = t1 - t0
@@ -475,6 +477,40 @@ class Book(BaseObject):
             except ValueError:
                 raise XLRDError('No sheet named <%r>' % sheet_name_or_index)
         self._sheet_list[sheetx] = None
+
+    ##
+    # Generate the rows of a worksheet as they are read from the file, without
+    # loading the sheet. Nothing is kept once a row has been yielded, so a sheet
+    # of any size can be processed in constant memory.
+    # @param sheet_name_or_index Name or index of sheet to be read.
+    # @return An iterator of (rowx, values, types) tuples, one for each row holding
+    # at least one cell, in row order. <i>values</i> is a list of cell values and
+    # <i>types</i> a list of the corresponding cell types (XL_CELL_xxx); trailing
+    # empty cells are omitted. The book must have been opened with on_demand=True,
+    # otherwise the file has already been released. XLRDError is raised if an .xls
+    # sheet writes a cell for a row that has already been yielded.
+    def iter_rows(self, sheet_name_or_index):
+        if isinstance(sheet_name_or_index, type(1)):
+            sheetx = sheet_name_or_index
+        else:
+            try:
+                sheetx = self._sheet_names.index(sheet_name_or_index)
+            except ValueError:
+                raise XLRDError('No sheet named <%r>' % sheet_name_or_index)
+        if self._resources_released:
+            raise XLRDError("Can't read sheets after releasing resources.")
+        return self._iter_rows(sheetx)
+
+    def _iter_rows(self, sheetx):
+        # BIFF: the Workbook stream is only kept when on_demand is true
+        self._position = self._sh_abs_posn[sheetx]
+        self.getbof(XL_WORKSHEET)
+        sh = sheet.Sheet(self,
+                self._position,
+                self._sheet_names[sheetx],
+                sheetx,
+                )
+        return sh.iter_rows(self)
         
     ##
     # This method has a dual purpose. You can call it to release
@@ -494,6 +530,9 @@ class Book(BaseObject):
         if hasattr(self.filestr, "close"):
             self.filestr.close()
         self.filestr = None
+        if self._zf is not None:
+            self._zf.close()
+        self._zf = None
         self._sharedstrings = None
         self._rich_text_runlist_map = None
     
@@ -540,6 +579,8 @@ class Book(BaseObject):
         self._extnsht_count = 0
         self._supbook_types = []
         self._resources_released = 0
+        self._zf = None # ZipFile of an xlsx workbook
+        self._sharedstring_indexes = None # string: index in _sharedstrings; for columnar sheets
         self.addin_func_names = []
         self.name_obj_list = []
         self.colour_map = {}
@@ -555,6 +596,7 @@ class Book(BaseObject):
         formatting_info=False,
         on_demand=False,
         ragged_rows=False,
+        columnar=False,
         ):
         # DEBUG = 0
         self.logfile = logfile
@@ -564,6 +606,7 @@ class Book(BaseObject):
         self.formatting_info = formatting_info
         self.on_demand = on_demand
         self.ragged_rows = ragged_rows
+        self.columnar = columnar
 
         if not file_contents:
             if python_version < (2, 2) and self.use_mmap:
@@ -688,7 +731,11 @@ class Book(BaseObject):
         # It appears to work OK if the sheet version is ignored.
         # Confirmed by Daniel Rentz: happens when Excel does "save as"
         # creating an old version file; ignore version details on sheet BOF.
-        sh = sheet.Sheet(self,
+        if self.columnar:
+            sheet_class = sheet.ColumnarSheet
+        else:
+            sheet_class = sheet.Sheet
+        sh = sheet_class(self,
                 self._position,
                 self._sheet_names[sh_number],
                 sh_number,
@@ -1154,7 +1201,7 @@ class Book(BaseObject):
             if DEBUG >= 2:
                 fprintf(self.logfile, "CONTINUE: adding %d bytes to SST -> %d\n", nb, nbt)
             strlist.append(data)
-        self._sharedstrings, rt_runlist = unpack_SST_table(strlist, uniquestrings)
+        self._sharedstrings, rt_runlist = unpack_SST_table_fast(strlist, uniquestrings)
         if self.formatting_info:
             self._rich_text_runlist_map = rt_runlist        
         if DEBUG:
@@ -1446,3 +1493,91 @@ def unpack_SST_table(datatab, nstrings):
                 assert _unused_i == nstrings - 1
         strappend(accstrg)
     return strings, richtext_runs
+
+_sst_header = struct.Struct('<HB')
+_sst_ushort = struct.Struct('<H')
+_sst_int = struct.Struct('<i')
+_sst_run = struct.Struct('<HH')
+
+def unpack_SST_table_fast(datatab, nstrings):
+    "Return list of strings. Same result as unpack_SST_table, faster"
+    # The SST record and its CONTINUE records are joined into one buffer, so
+    # that all but the string data can be read straight across record ends.
+    # A string whose characters run into the next record is the only special
+    # case: the next record starts with a fresh options byte, which may switch
+    # between compressed and UTF-16. Any other string is decoded in one go
+    # from a slice of the buffer.
+    data = b''.join(datatab)
+    ends = []
+    end = 0
+    for record in datatab:
+        end += len(record)
+        ends.append(end)
+    datainx = 0
+    datalen = ends[0] # end of the current record in data
+    pos = 8
+    strings = []
+    strappend = strings.append
+    richtext_runs = {}
+    header_unpack = _sst_header.unpack_from
+    ushort_unpack = _sst_ushort.unpack_from
+    int_unpack = _sst_int.unpack_from
+    run_unpack = _sst_run.unpack_from
+    local_unicode = unicode
+    local_BYTES_ORD = BYTES_ORD
+    latin_1 = "latin_1"
+    utf_16_le = "utf_16_le"
+    for stringx in xrange(nstrings):
+        while pos >= datalen:
+            datainx += 1
+            datalen = ends[datainx]
+        nchars, options = header_unpack(data, pos)
+        pos += 3
+        rtcount = 0
+        phosz = 0
+        if options & 0x08: # richtext
+            rtcount = ushort_unpack(data, pos)[0]
+            pos += 2
+        if options & 0x04: # phonetic
+            phosz = int_unpack(data, pos)[0]
+            pos += 4
+        if options & 0x01:
+            endpos = pos + 2 * nchars
+        else:
+            endpos = pos + nchars
+        if endpos <= datalen:
+            if options & 0x01:
+                strappend(local_unicode(data[pos:endpos], utf_16_le))
+            else:
+                # Note: this is COMPRESSED (not ASCII!) encoding!!!
+                strappend(local_unicode(data[pos:endpos], latin_1))
+            pos = endpos
+        else:
+            # continued in the next record(s)
+            pieces = []
+            charsneed = nchars
+            while 1:
+                if options & 0x01:
+                    charsavail = min((datalen - pos) >> 1, charsneed)
+                    nbytes = 2 * charsavail
+                    encoding = utf_16_le
+                else:
+                    charsavail = min(datalen - pos, charsneed)
+                    nbytes = charsavail
+                    encoding = latin_1
+                pieces.append(local_unicode(data[pos:pos+nbytes], encoding))
+                pos += nbytes
+                charsneed -= charsavail
+                if not charsneed:
+                    break
+                pos = datalen
+                datainx += 1
+                datalen = ends[datainx]
+                options = local_BYTES_ORD(data[pos])
+                pos += 1
+            strappend(UNICODE_LITERAL('').join(pieces))
+        if rtcount:
+            richtext_runs[stringx] = [run_unpack(data, pos + 4 * runindex) for runindex in xrange(rtcount)]
+            pos += 4 * rtcount
+        pos += phosz # size of the phonetic stuff to skip
+    return strings, richtext_runs
@@ -5,6 +5,7 @@
 # <p>This module is part of the xlrd package, which is released under a BSD-style licence.</p>
 ##
 
+# 2026-10-18     Added ColumnarSheet for open_workbook(columnar=True)
 # 2010-04-25 SJM fix zoom factors cooking logic
 # 2010-04-15 CW  r4253 fix zoom factors cooking logic
 # 2010-04-09 CW  r4248 add a flag so xlutils knows whether or not to write a PANE record
@@ -35,6 +36,10 @@ from .biffh import *
 from .timemachine import *
 from .formula import dump_formula, decompile_formula, rangename2d, FMLA_TYPE_CELL, FMLA_TYPE_SHARED
 from .formatting import nearest_colour_index, Format
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 DEBUG = 0
 OBJ_MSO_DEBUG = 0
@@ -454,7 +459,7 @@ class Sheet(BaseObject):
     def row(self, rowx):
         return [
             self.cell(rowx, colx)
-            for colx in xrange(len(self._cell_values[rowx]))
+            for colx in xrange(self.row_len(rowx))
             ]
 
     ##
@@ -476,7 +481,7 @@ class Sheet(BaseObject):
     ##
     # Returns a slice of the {@link #Cell} objects in the given row.
     def row_slice(self, rowx, start_colx=0, end_colx=None):
-        nc = len(self._cell_values[rowx])
+        nc = self.row_len(rowx)
         if start_colx < 0:
             start_colx += nc
             if start_colx < 0:
@@ -1468,6 +1473,137 @@ class Sheet(BaseObject):
         bk._position = oldpos
         return 1
     
+    ##
+    # Generate (rowx, values, types) for each row of the sheet, reading its
+    # records from the book without storing the cells; used by Book.iter_rows.
+    # Rows are held only until the DBCELL record that ends their row block (at
+    # most 32 rows in files written by Excel), then yielded in row order, so
+    # cells that arrive out of row order within a block are still placed
+    # correctly. Files without DBCELL records are buffered until EOF.
+    def iter_rows(self, bk):
+        local_unpack = unpack
+        bv = self.biff_version
+        fmt_info = self.formatting_info
+        xf_type_map = self._xf_index_to_xl_type_map
+        pending = {} # rowx: (values, types) of rows not yet yielded
+        yielded = [-1] # last rowx yielded
+
+        def put_cell(rowx, colx, ctype, value, xf_index):
+            if rowx <= yielded[0]:
+                raise XLRDError("Cell (%d, %d) found after row %d was yielded; "
+                    "rows are not stored in order, use sheet_by_index" % (rowx, colx, yielded[0]))
+            if ctype is None:
+                # we have a number, so look up the cell type
+                ctype = xf_type_map[xf_index]
+            row = pending.get(rowx)
+            if row is None:
+                row = pending[rowx] = ([], [])
+            values, types = row
+            num_empty = colx - len(values)
+            if num_empty >= 0:
+                if num_empty:
+                    values.extend([''] * num_empty)
+                    types.extend([XL_CELL_EMPTY] * num_empty)
+                values.append(value)
+                types.append(ctype)
+            else:
+                values[colx] = value
+                types[colx] = ctype
+
+        position = self._position
+        while 1:
+            # Other sheets may be read between rows, so keep our own position
+            bk._position = position
+            rc, data_len, data = bk.get_record_parts()
+            if rc == XL_NUMBER:
+                rowx, colx, xf_index, d = local_unpack('<HHHd', data[:14])
+                put_cell(rowx, colx, None, d, xf_index)
+            elif rc == XL_LABELSST:
+                rowx, colx, xf_index, sstindex = local_unpack('<HHHi', data)
+                put_cell(rowx, colx, XL_CELL_TEXT, bk._sharedstrings[sstindex], xf_index)
+            elif rc == XL_LABEL or rc == XL_RSTRING:
+                rowx, colx, xf_index = local_unpack('<HHH', data[0:6])
+                if bv < BIFF_FIRST_UNICODE:
+                    strg = unpack_string(data, 6, bk.encoding or bk.derive_encoding(), lenlen=2)
+                else:
+                    strg = unpack_unicode(data, 6, lenlen=2)
+                put_cell(rowx, colx, XL_CELL_TEXT, strg, xf_index)
+            elif rc == XL_RK:
+                rowx, colx, xf_index = local_unpack('<HHH', data[:6])
+                put_cell(rowx, colx, None, unpack_RK(data[6:10]), xf_index)
+            elif rc == XL_MULRK:
+                mulrk_row, mulrk_first = local_unpack('<HH', data[0:4])
+                mulrk_last, = local_unpack('<H', data[-2:])
+                pos = 4
+                for colx in xrange(mulrk_first, mulrk_last+1):
+                    xf_index, = local_unpack('<H', data[pos:pos+2])
+                    put_cell(mulrk_row, colx, None, unpack_RK(data[pos+2:pos+6]), xf_index)
+                    pos += 6
+            elif rc in XL_FORMULA_OPCODES:
+                rowx, colx, xf_index, result_str = local_unpack('<HHH8s', data[0:14])
+                if result_str[6:8] == b"\xFF\xFF":
+                    first_byte = BYTES_ORD(result_str[0])
+                    if first_byte == 0:
+                        # string result is in the next STRING record, possibly
+                        # after a SHRFMLA, ARRAY or TABLEOP record
+                        rc2, _unused_len, data2 = bk.get_record_parts()
+                        if rc2 != XL_STRING and rc2 != XL_STRING_B2:
+                            rc2, _unused_len, data2 = bk.get_record_parts()
+                        if rc2 != XL_STRING and rc2 != XL_STRING_B2:
+                            raise XLRDError("Expected STRING record; found 0x%04x" % rc2)
+                        put_cell(rowx, colx, XL_CELL_TEXT, self.string_record_contents(data2), xf_index)
+                    elif first_byte == 1:
+                        put_cell(rowx, colx, XL_CELL_BOOLEAN, BYTES_ORD(result_str[2]), xf_index)
+                    elif first_byte == 2:
+                        put_cell(rowx, colx, XL_CELL_ERROR, BYTES_ORD(result_str[2]), xf_index)
+                    elif first_byte == 3:
+                        # empty ... i.e. empty (zero-length) string, NOT an empty cell.
+                        put_cell(rowx, colx, XL_CELL_TEXT, "", xf_index)
+                    else:
+                        raise XLRDError("unexpected special case (0x%02x) in FORMULA" % first_byte)
+                else:
+                    put_cell(rowx, colx, None, local_unpack('<d', result_str)[0], xf_index)
+            elif rc == XL_BOOLERR:
+                rowx, colx, xf_index, value, is_err = local_unpack('<HHHBB', data[:8])
+                put_cell(rowx, colx, (XL_CELL_BOOLEAN, XL_CELL_ERROR)[is_err], value, xf_index)
+            elif rc == XL_BLANK:
+                if fmt_info:
+                    rowx, colx, xf_index = local_unpack('<HHH', data[:6])
+                    put_cell(rowx, colx, XL_CELL_BLANK, '', xf_index)
+            elif rc == XL_MULBLANK:
+                if fmt_info:
+                    nitems = data_len >> 1
+                    result = local_unpack("<%dH" % nitems, data)
+                    rowx, mul_first = result[:2]
+                    pos = 2
+                    for colx in xrange(mul_first, result[-1] + 1):
+                        put_cell(rowx, colx, XL_CELL_BLANK, '', result[pos])
+                        pos += 1
+            elif rc in bofcodes: # embedded chart: skip to its EOF
+                while bk.get_record_parts()[0] != XL_EOF:
+                    pass
+            elif rc == XL_DBCELL or rc == XL_EOF or (rc == XL_ROW and pending):
+                # end of row block or sheet. xlwt and others write no DBCELL
+                # records; cells follow the ROW records of their block, so a
+                # ROW record after cells also ends the rows above it. Writers
+                # may also emit a ROW record part way through the cells, so
+                # the highest row holding cells is kept back too.
+                position = bk._position
+                if rc == XL_ROW:
+                    end_rowx = min(local_unpack('<H', data[:2])[0], max(pending))
+                else:
+                    end_rowx = None
+                for rowx in sorted(pending):
+                    if end_rowx is not None and rowx >= end_rowx:
+                        break
+                    values, types = pending.pop(rowx)
+                    yielded[0] = rowx
+                    yield rowx, values, types
+                if rc == XL_EOF:
+                    return
+                continue
+            position = bk._position
+
     def string_record_contents(self, data):
         bv = self.biff_version
         bk = self.book
@@ -2058,6 +2194,194 @@ class Sheet(BaseObject):
             rupBuild, unusedShort,listFlags, lPosStmCache, cbStmCache,
             cchStmCache, lem, rgbHashParam, cchName), file=self.logfile)
 
+##
+# <p>A worksheet that stores its cells by column instead of as a list of Python
+# objects per row. Used instead of {@link #Sheet} when the workbook is opened with
+# open_workbook(columnar=True).</p>
+#
+# <p>Each column holds the cell types in an array('B'), numeric values (numbers,
+# dates, booleans and error codes) in an array('d') with NaN for other cells, and,
+# only once the column has any text, indexes into {@link #ColumnarSheet.strings}
+# in an array('i') with -1 for other cells. A numeric cell costs 9 bytes instead of
+# a boxed float plus a list slot.</p>
+#
+# <p>col_numbers(), col_mask() and col_string_indexes() return NumPy views of the
+# columns (no copying) when NumPy is installed, or array slices otherwise. The
+# cell and row/column methods of Sheet still work, and return the usual Python
+# values. Formatting information is not kept.</p>
+# <br /> -- Columnar storage mode.
+
+class ColumnarSheet(Sheet):
+
+    ##
+    # The shared-string table of the book, with any strings that were not in
+    # it (e.g. from LABEL records or inline strings) added at the end.
+    strings = []
+
+    def __init__(self, book, position, name, number):
+        Sheet.__init__(self, book, position, name, number)
+        self.ragged_rows = True # rows are never padded; columns are padded by tidy_dimensions
+        self.put_cell = self.put_cell_columnar
+        self.strings = book._sharedstrings
+        if book._sharedstring_indexes is None:
+            book._sharedstring_indexes = dict((strg, sstindex) for sstindex, strg in enumerate(self.strings))
+        self._string_indexes = book._sharedstring_indexes
+        self._col_types = []
+        self._col_numbers = []
+        self._col_strings = [] # None until the column has a text cell
+        self._nan = array('d', [float('nan')])
+        self._no_string = array('i', [-1])
+
+    ##
+    # Numeric values of the cells in the given column, NaN for cells that are
+    # not numbers, dates, booleans or errors.
+    def col_numbers(self, colx, start_rowx=0, end_rowx=None):
+        start_rowx, end_rowx = self._col_bounds(start_rowx, end_rowx)
+        numbers = self._col_numbers[colx]
+        if numpy is None:
+            return numbers[start_rowx:end_rowx]
+        return _numpy_view(numbers, numpy.float64)[start_rowx:end_rowx]
+
+    ##
+    # Validity mask of the given column: true where the cell is a number or date.
+    def col_mask(self, colx, start_rowx=0, end_rowx=None):
+        start_rowx, end_rowx = self._col_bounds(start_rowx, end_rowx)
+        types = self._col_types[colx]
+        if numpy is None:
+            return array('B', [
+                ctype == XL_CELL_NUMBER or ctype == XL_CELL_DATE
+                for ctype in types[start_rowx:end_rowx]
+                ])
+        types = _numpy_view(types, numpy.uint8)[start_rowx:end_rowx]
+        return (types == XL_CELL_NUMBER) | (types == XL_CELL_DATE)
+
+    ##
+    # Indexes into {@link #ColumnarSheet.strings} of the cells in the given column,
+    # -1 for cells that are not text.
+    def col_string_indexes(self, colx, start_rowx=0, end_rowx=None):
+        start_rowx, end_rowx = self._col_bounds(start_rowx, end_rowx)
+        strings = self._col_strings[colx]
+        if strings is None:
+            strings = self._no_string * (end_rowx - start_rowx)
+            start_rowx, end_rowx = 0, None
+        if numpy is None:
+            return strings[start_rowx:end_rowx]
+        return _numpy_view(strings, numpy.intc)[start_rowx:end_rowx]
+
+    def cell(self, rowx, colx):
+        return Cell(self.cell_type(rowx, colx), self.cell_value(rowx, colx))
+
+    def cell_value(self, rowx, colx):
+        ctype = self._col_types[colx][rowx]
+        if ctype == XL_CELL_TEXT:
+            return self.strings[self._col_strings[colx][rowx]]
+        if ctype == XL_CELL_NUMBER or ctype == XL_CELL_DATE:
+            return self._col_numbers[colx][rowx]
+        if ctype == XL_CELL_BOOLEAN or ctype == XL_CELL_ERROR:
+            return int(self._col_numbers[colx][rowx])
+        return ''
+
+    def cell_type(self, rowx, colx):
+        return self._col_types[colx][rowx]
+
+    def row_len(self, rowx):
+        return self.ncols
+
+    def row_types(self, rowx, start_colx=0, end_colx=None):
+        return array('B', [types[rowx] for types in self._col_types[start_colx:end_colx]])
+
+    def row_values(self, rowx, start_colx=0, end_colx=None):
+        return [
+            self.cell_value(rowx, colx)
+            for colx in range(self.ncols)[start_colx:end_colx]
+            ]
+
+    def col_values(self, colx, start_rowx=0, end_rowx=None):
+        start_rowx, end_rowx = self._col_bounds(start_rowx, end_rowx)
+        return [
+            self.cell_value(rowx, colx)
+            for rowx in xrange(start_rowx, end_rowx)
+            ]
+
+    def col_types(self, colx, start_rowx=0, end_rowx=None):
+        start_rowx, end_rowx = self._col_bounds(start_rowx, end_rowx)
+        return list(self._col_types[colx][start_rowx:end_rowx])
+
+    def _col_bounds(self, start_rowx, end_rowx):
+        nr = self.nrows
+        if start_rowx < 0:
+            start_rowx += nr
+            if start_rowx < 0:
+                start_rowx = 0
+        if end_rowx is None or end_rowx > nr:
+            end_rowx = nr
+        elif end_rowx < 0:
+            end_rowx += nr
+        return start_rowx, end_rowx
+
+    # === Following methods are used in building the worksheet.
+    # === They are not part of the API.
+
+    def tidy_dimensions(self):
+        Sheet.tidy_dimensions(self)
+        # make all columns nrows long
+        self._add_columns(self.ncols)
+        nrows = self.nrows
+        for colx in xrange(self.ncols):
+            num_empty = nrows - len(self._col_types[colx])
+            if num_empty > 0:
+                self._extend_column(colx, num_empty)
+
+    def put_cell_columnar(self, rowx, colx, ctype, value, xf_index):
+        if ctype is None:
+            # we have a number, so look up the cell type
+            ctype = self._xf_index_to_xl_type_map[xf_index]
+        if colx >= self.ncols:
+            self._add_columns(colx + 1)
+            self.ncols = colx + 1
+        if rowx >= self.nrows:
+            self.nrows = rowx + 1
+        types = self._col_types[colx]
+        num_empty = rowx + 1 - len(types)
+        if num_empty == 1:
+            # most common case: rowx == previous rowx + 1
+            types.append(XL_CELL_EMPTY)
+            self._col_numbers[colx].append(self._nan[0])
+            if self._col_strings[colx] is not None:
+                self._col_strings[colx].append(-1)
+        elif num_empty > 0:
+            self._extend_column(colx, num_empty)
+        types[rowx] = ctype
+        strings = self._col_strings[colx]
+        if ctype == XL_CELL_TEXT:
+            if strings is None:
+                strings = self._col_strings[colx] = self._no_string * len(types)
+            index = self._string_indexes.get(value)
+            if index is None:
+                index = self._string_indexes[value] = len(self.strings)
+                self.strings.append(value)
+            strings[rowx] = index
+            self._col_numbers[colx][rowx] = self._nan[0]
+        else:
+            if strings is not None:
+                strings[rowx] = -1
+            if ctype == XL_CELL_EMPTY or ctype == XL_CELL_BLANK:
+                self._col_numbers[colx][rowx] = self._nan[0]
+            else:
+                self._col_numbers[colx][rowx] = value
+
+    def _add_columns(self, ncols):
+        while len(self._col_types) < ncols:
+            self._col_types.append(self.bt * 0)
+            self._col_numbers.append(self._nan * 0)
+            self._col_strings.append(None)
+
+    def _extend_column(self, colx, num_empty):
+        self._col_types[colx].extend(self.bt * num_empty)
+        self._col_numbers[colx].extend(self._nan * num_empty)
+        if self._col_strings[colx] is not None:
+            self._col_strings[colx].extend(self._no_string * num_empty)
+
 class MSODrawing(BaseObject):
     pass
 
@@ -2149,6 +2473,12 @@ class Hyperlink(BaseObject):
 
 # === helpers ===
 
+def _numpy_view(column, dtype):
+    # Zero-copy NumPy array over an array.array column
+    if not len(column):
+        return numpy.zeros(0, dtype)
+    return numpy.frombuffer(column, dtype)
+
 def unpack_RK(rk_str):
     flags = BYTES_ORD(rk_str[0])
     if flags & 2:
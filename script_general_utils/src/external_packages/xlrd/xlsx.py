@@ -11,9 +11,9 @@ import sys
 import re
 from .timemachine import *
 from .book import Book, Name
-from .biffh import error_text_from_code, XLRDError, XL_CELL_BLANK, XL_CELL_TEXT, XL_CELL_BOOLEAN, XL_CELL_ERROR
+from .biffh import error_text_from_code, XLRDError, XL_CELL_EMPTY, XL_CELL_BLANK, XL_CELL_TEXT, XL_CELL_BOOLEAN, XL_CELL_ERROR
 from .formatting import is_date_format_string, Format, XF
-from .sheet import Sheet
+from .sheet import Sheet, ColumnarSheet
 
 DLF = sys.stdout # Default Log File
 
@@ -55,6 +55,9 @@ def ensure_elementtree_imported(verbosity, logfile):
             ])
         print(ET.__file__, ET.__name__, etree_version, ET_has_iterparse, file=logfile)
         
+# cElementTree in Python 2 wants native strings, not unicode literals
+ITERPARSE_EVENTS = (str('start'), str('end'))
+
 def split_tag(tag):
     pos = tag.rfind('}') + 1
     if pos >= 2:
@@ -364,10 +367,7 @@ class X12Book(X12General):
                 self.dumpout('Ignoring sheet of type %r (name=%r)', reltype, name)
             return
         bk._sheet_visibility.append(True)
-        sheet = Sheet(bk, position=None, name=name, number=sheetx)
-        sheet.utter_max_rows = X12_MAX_ROWS
-        sheet.utter_max_cols = X12_MAX_COLS
-        bk._sheet_list.append(sheet)
+        bk._sheet_list.append(None) # loaded by bk.get_sheet
         bk._sheet_names.append(name)
         bk.nsheets += 1
         self.sheet_targets.append(target)
@@ -387,6 +387,15 @@ class X12Book(X12General):
         }
     augment_keys(tag2meth, U_SSML12)
 
+def new_sheet(bk, name, sheetx, columnar=False):
+    if columnar:
+        sheet = ColumnarSheet(bk, position=None, name=name, number=sheetx)
+    else:
+        sheet = Sheet(bk, position=None, name=name, number=sheetx)
+    sheet.utter_max_rows = X12_MAX_ROWS
+    sheet.utter_max_cols = X12_MAX_COLS
+    return sheet
+
 class X12SST(X12General):
 
     def __init__(self, bk, logfile=DLF, verbosity=0):
@@ -506,6 +515,7 @@ class X12Sheet(X12General):
         self.sst = self.bk._sharedstrings
         self.warned_no_cell_name = 0
         self.warned_no_row_num = 0
+        self.put_cell = sheet.put_cell
         if ET_has_iterparse:
             self.process_stream = self.own_process_stream
 
@@ -522,7 +532,52 @@ class X12Sheet(X12General):
             elif elem.tag == U_SSML12 + "dimension":
                 self.do_dimension(elem)
         self.finish_off()
-        
+
+    def iter_rows(self, stream, heading=None):
+        # Generate (rowx, values, types) for each <row> as it is parsed.
+        # Nothing is stored in the sheet: each row's cells are collected into
+        # fresh lists and the parsed rows are cleared from the tree, so memory
+        # use does not grow with the size of the sheet.
+        # Rows are ragged (no trailing empty cells); missing rows are not yielded.
+        if not ET_has_iterparse:
+            raise XLRDError("Streaming rows needs an ElementTree with iterparse")
+        if self.verbosity >= 2 and heading is not None:
+            fprintf(self.logfile, "\n=== %s ===\n", heading)
+        self.put_cell = self.put_streamed_cell
+        row_tag = U_SSML12 + "row"
+        dimension_tag = U_SSML12 + "dimension"
+        sheet_data_tag = U_SSML12 + "sheetData"
+        sheet_data = None
+        for event, elem in ET.iterparse(stream, events=ITERPARSE_EVENTS):
+            if event == 'start':
+                if elem.tag == sheet_data_tag:
+                    sheet_data = elem
+            elif elem.tag == row_tag:
+                self.row_values = []
+                self.row_types = []
+                self.do_row(elem)
+                sheet_data.clear() # destroy the rows done so far
+                yield self.rowx, self.row_values, self.row_types
+            elif elem.tag == dimension_tag:
+                self.do_dimension(elem)
+        self.finish_off()
+
+    def put_streamed_cell(self, rowx, colx, ctype, value, xf_index):
+        if ctype is None:
+            # we have a number, so look up the cell type
+            ctype = self.bk._xf_index_to_xl_type_map[xf_index]
+        values = self.row_values
+        num_empty = colx - len(values)
+        if num_empty >= 0:
+            if num_empty:
+                values.extend([''] * num_empty)
+                self.row_types.extend([XL_CELL_EMPTY] * num_empty)
+            values.append(value)
+            self.row_types.append(ctype)
+        else:
+            values[colx] = value
+            self.row_types[colx] = ctype
+
     def do_dimension(self, elem):
         ref = elem.get('ref') # example: "A1:Z99" or just "A1"
         if ref:
@@ -550,6 +605,7 @@ class X12Sheet(X12General):
         assert 0 <= self.rowx < X12_MAX_ROWS
         rowx = self.rowx
         colx = -1
+        put_cell = self.put_cell
         if self.verbosity >= 3:
             self.dumpout("<row> row_number=%r rowx=%d explicit=%d",
                 row_number, self.rowx, explicit_row_number)
@@ -598,9 +654,9 @@ class X12Sheet(X12General):
                         raise Exception('unexpected tag %r' % child_tag)
                 if not tvalue:
                     if self.bk.formatting_info:
-                        self.sheet.put_cell(rowx, colx, XL_CELL_BLANK, '', xf_index)
+                        put_cell(rowx, colx, XL_CELL_BLANK, '', xf_index)
                 else:
-                    self.sheet.put_cell(rowx, colx, None, float(tvalue), xf_index)
+                    put_cell(rowx, colx, None, float(tvalue), xf_index)
             elif cell_type == "s":
                 # s = index into shared string table. 2nd most frequent type
                 # <v> child contains plain text which can go straight into int()
@@ -616,10 +672,10 @@ class X12Sheet(X12General):
                 if not tvalue:
                     # <c r="A1" t="s"/>
                     if self.bk.formatting_info:
-                        self.sheet.put_cell(rowx, colx, XL_CELL_BLANK, '', xf_index)
+                        put_cell(rowx, colx, XL_CELL_BLANK, '', xf_index)
                 else:
                     value = self.sst[int(tvalue)]
-                    self.sheet.put_cell(rowx, colx, XL_CELL_TEXT, value, xf_index)
+                    put_cell(rowx, colx, XL_CELL_TEXT, value, xf_index)
             elif cell_type == "str":
                 # str = string result from formula.
                 # Should have <f> (formula) child; however in one file, all text cells are str with no formula.
@@ -634,7 +690,7 @@ class X12Sheet(X12General):
                         bad_child_tag(child_tag)
                 # assert tvalue is not None and formula is not None
                 # Yuk. Fails with file created by gnumeric -- no tvalue!
-                self.sheet.put_cell(rowx, colx, XL_CELL_TEXT, tvalue, xf_index)
+                put_cell(rowx, colx, XL_CELL_TEXT, tvalue, xf_index)
             elif cell_type == "b":
                 # b = boolean
                 # <v> child contains "0" or "1"
@@ -648,7 +704,7 @@ class X12Sheet(X12General):
                         formula = cooked_text(self, child)
                     else:
                         bad_child_tag(child_tag)
-                self.sheet.put_cell(rowx, colx, XL_CELL_BOOLEAN, int(tvalue), xf_index)
+                put_cell(rowx, colx, XL_CELL_BOOLEAN, int(tvalue), xf_index)
             elif cell_type == "e":
                 # e = error
                 # <v> child contains e.g. "#REF!"
@@ -661,7 +717,7 @@ class X12Sheet(X12General):
                     else:
                         bad_child_tag(child_tag)
                 value = error_code_from_text[tvalue]
-                self.sheet.put_cell(rowx, colx, XL_CELL_ERROR, value, xf_index)
+                put_cell(rowx, colx, XL_CELL_ERROR, value, xf_index)
             elif cell_type == "inlineStr":
                 # Not expected in files produced by Excel.
                 # Only possible child is <is>.
@@ -674,7 +730,7 @@ class X12Sheet(X12General):
                     else:
                         bad_child_tag(child_tag)
                 assert tvalue is not None
-                self.sheet.put_cell(rowx, colx, XL_CELL_TEXT, tvalue, xf_index)
+                put_cell(rowx, colx, XL_CELL_TEXT, tvalue, xf_index)
             else:
                 raise Exception("Unknown cell type %r in rowx=%d colx=%d" % (cell_type, rowx, colx))
 
@@ -701,6 +757,7 @@ def open_workbook_2007_xml(
     formatting_info=0,
     on_demand=0,
     ragged_rows=0,
+    columnar=0,
     ):
     ensure_elementtree_imported(verbosity, logfile)
     bk = Book()
@@ -711,11 +768,9 @@ def open_workbook_2007_xml(
         raise NotImplementedError("formatting_info=True not yet implemented")
     bk.use_mmap = False #### Not supported initially
     bk.on_demand = on_demand
-    if on_demand:
-        if verbosity:
-            print("WARNING *** on_demand=True not yet implemented; falling back to False", file=bk.logfile)
-        bk.on_demand = False
     bk.ragged_rows = ragged_rows
+    bk.columnar = columnar
+    bk._zf = zf # kept open for loading sheets on demand and Book.iter_rows; closed by release_resources
 
     x12book = X12Book(bk, logfile, verbosity)
     zflo = getzflo(zf, 'xl/_rels/workbook.xml.rels')
@@ -745,14 +800,33 @@ def open_workbook_2007_xml(
         x12sst.process_stream(zflo, 'SST')
         del zflo
 
-    for sheetx in range(bk.nsheets):
+    def get_sheet(sheetx, update_pos=True):
+        # Parse a sheet's XML; replaces Book.get_sheet (BIFF only)
+        if bk._resources_released:
+            raise XLRDError("Can't load sheets after releasing resources.")
         fname = x12book.sheet_targets[sheetx]
         zflo = getzflo(zf, fname)
-        sheet = bk._sheet_list[sheetx]
+        sheet = new_sheet(bk, bk._sheet_names[sheetx], sheetx, columnar)
         x12sheet = X12Sheet(sheet, logfile, verbosity)
         heading = "Sheet %r (sheetx=%d) from %r" % (sheet.name, sheetx, fname)
         x12sheet.process_stream(zflo, heading)
         del zflo
         sheet.tidy_dimensions()
+        bk._sheet_list[sheetx] = sheet
+        return sheet
+    bk.get_sheet = get_sheet
+
+    if not on_demand:
+        for sheetx in range(bk.nsheets):
+            get_sheet(sheetx)
+        bk.release_resources() # closes the zip file, as for BIFF
+
+    def iter_rows(sheetx):
+        fname = x12book.sheet_targets[sheetx]
+        sheet = new_sheet(bk, bk._sheet_names[sheetx], sheetx)
+        x12sheet = X12Sheet(sheet, logfile, verbosity)
+        heading = "Sheet %r (sheetx=%d) rows from %r" % (sheet.name, sheetx, fname)
+        return x12sheet.iter_rows(getzflo(zf, fname), heading)
+    bk._iter_rows = iter_rows
 
     return bk
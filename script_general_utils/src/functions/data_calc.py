@@ -24,9 +24,13 @@ License:     Although this application has been produced and tested
 ****************************************************************************"""
 import os
 import math
+import numpy
 import arcpy  # @UnresolvedImport
 from arcpy import sa as spatial  # @UnresolvedImport
 
+# Field order of the records returned by the array based hypsometry functions.
+HYPSOMETRY_FIELDS = ('BINS', 'STEP_SIZE', 'COUNT', 'AREA', 'MIN_ELEV', 'MEAN_ELEV', 'MAX_ELEV')
+
 
 def calc_length (feature, length_field = 'LENGTH'):
     """Calculate the length of a line segment. This function calculates 
@@ -100,6 +104,68 @@ def calc_slope (feature, bin_mask, bin_size = 50, sort_by = 'BINS'):
     
     arcpy.Delete_management(selection)
     return feature_list
+
+
+def calc_slope_array (x, y, dem, geotransform, bin_size = 50, spacing = None, nodata = None):
+    """Calculate slope information along the center line without clipping it to 
+    bin polygons. The center line is given by arrays of vertex coordinates and is
+    sampled every 'spacing' map units (the cell size if not given) from a DEM, or
+    a bin raster, held in a numpy array. 'geotransform' uses the GDAL order: 
+    (left, x cell size, 0, top, 0, -y cell size). Where the line crosses from one 
+    bin to the next the crossing point is found by linear interpolation. Returns
+    a list of tuples sorted by bin in the same form as 'calc_slope': 
+    (bin, line_len, cum_length, slope), except the first item is the bin (low 
+    value) rather then a clipped geometry. The same first / last bin caveats apply."""
+    left, x_size, _, top, _, y_size = geotransform
+    x, y = numpy.asarray(x, dtype = float), numpy.asarray(y, dtype = float)
+    if spacing is None: spacing = abs(x_size)
+    
+    # Re-sample the line at an even spacing along its length
+    distance = numpy.concatenate(([0], numpy.cumsum(numpy.hypot(numpy.diff(x), numpy.diff(y)))))
+    stations = numpy.union1d(numpy.arange(0, distance[-1], spacing), distance)
+    xs = numpy.interp(stations, distance, x)
+    ys = numpy.interp(stations, distance, y)
+    
+    # Sample the DEM at each point (cells off the DEM or nodata are NaN)
+    dem = numpy.asarray(dem)
+    columns = numpy.floor((xs - left) / abs(x_size)).astype(int)
+    rows = numpy.floor((top - ys) / abs(y_size)).astype(int)
+    inside = (rows >= 0) & (rows < dem.shape[0]) & (columns >= 0) & (columns < dem.shape[1])
+    z = numpy.empty(xs.size)
+    z.fill(numpy.nan)
+    z[inside] = dem[rows[inside], columns[inside]]
+    if nodata is not None: z[z == nodata] = numpy.nan
+    
+    # Segments between neighbouring points
+    length = numpy.diff(stations)
+    z0, z1 = z[:-1], z[1:]
+    usable = numpy.isfinite(z0) & numpy.isfinite(z1) & (length > 0)
+    b0 = numpy.floor(z0[usable] / bin_size).astype(int)
+    b1 = numpy.floor(z1[usable] / bin_size).astype(int)
+    length, z0, z1 = length[usable], z0[usable], z1[usable]
+    if length.size == 0: return []
+    
+    # Segments within one bin are summed together
+    offset = min(b0.min(), b1.min())
+    totals = numpy.bincount(b0[b0 == b1] - offset, weights = length[b0 == b1], 
+                            minlength = max(b0.max(), b1.max()) - offset + 1).astype(float)
+    
+    # Segments that cross bins are split where they cross each bin boundary
+    for i in numpy.flatnonzero(b0 != b1):
+        step = 1 if b1[i] > b0[i] else -1
+        boundaries = numpy.arange(b0[i] + (step > 0), b1[i] + (step > 0), step) * bin_size
+        fractions = numpy.concatenate(([0], (boundaries - z0[i]) / (z1[i] - z0[i]), [1]))
+        pieces = numpy.diff(fractions) * length[i]
+        totals[numpy.arange(b0[i], b1[i] + step, step) - offset] += pieces
+    
+    feature_list = list()
+    cum_length = 0
+    for index in numpy.flatnonzero(totals):
+        line_len = float(totals[index])
+        cum_length += line_len
+        slope = round(math.degrees(math.atan(bin_size / line_len)), 1)
+        feature_list.append((int(index + offset) * bin_size, line_len, cum_length, slope))
+    return feature_list
     
     
 
@@ -148,6 +214,96 @@ def bin_by_dem (feature, dem, scratch, name = None, bin_size = 50):
     return name
 
 
+def bin_by_dem_array (dem, mask = None, bin_size = 50, cell_area = 1.0, nodata = None):
+    """Calculate bins from a digital elevation model (DEM) held in a numpy array
+    and return bin statistics without any geoprocessing. 'mask' is a boolean array
+    the same shape as the DEM that is True over the glacier. Returns a list of
+    tuples, one per bin with cells, in the order of HYPSOMETRY_FIELDS: 
+    (BINS, STEP_SIZE, COUNT, AREA, MIN_ELEV, MEAN_ELEV, MAX_ELEV). BINS is the 
+    low value of the bin as in 'bin_by_dem'. The DEM is not filled."""
+    valid, values, bins = _bin_values(dem, mask, bin_size, nodata)
+    if values.size == 0: return []
+    
+    groups, counts, sums, minimums, maximums = _group_statistics(bins, values)
+    return [(int(groups[i]) * bin_size, bin_size, int(counts[i]), float(counts[i] * cell_area), 
+             float(minimums[i]), float(sums[i] / counts[i]), float(maximums[i])) 
+            for i in range (0, groups.size)]
+
+
+def bin_by_dem_batch (dem, glaciers, bin_size = 50, cell_area = 1.0, nodata = None, glacier_nodata = 0):
+    """Calculate bins for every glacier in a single pass over a DEM held in a 
+    numpy array. 'glaciers' is an integer array, aligned to the DEM, labelling
+    each cell with its glacier id ('glacier_nodata' marks cells off glacier). 
+    Each (glacier, bin) pair is given a single key so all glaciers are binned 
+    together. Records are yielded one at a time, ordered by glacier id and bin,
+    as (GLACIER_ID,) + HYPSOMETRY_FIELDS so they can be streamed to a file or
+    database (see 'hypsometry_to_csv' and 'hypsometry_to_database')."""
+    glaciers = numpy.asarray(glaciers)
+    valid, values, bins = _bin_values(dem, glaciers != glacier_nodata, bin_size, nodata)
+    if values.size == 0: return
+    
+    # Number glaciers 0..n so the (glacier, bin) key stays compact
+    ids, labels = numpy.unique(glaciers[valid], return_inverse = True)
+    total_bins = int(math.ceil(8850.0 / float(bin_size)))
+    keys = labels.astype(numpy.int64) * total_bins + bins
+    
+    groups, counts, sums, minimums, maximums = _group_statistics(keys, values)
+    for i in range (0, groups.size):
+        glacier, bin_num = divmod(int(groups[i]), total_bins)
+        yield (ids[glacier].item(), bin_num * bin_size, bin_size, int(counts[i]), 
+               float(counts[i] * cell_area), float(minimums[i]), 
+               float(sums[i] / counts[i]), float(maximums[i]))
+
+
+def hypsometry_to_csv (records, csv):
+    """Prints hypsometry records to an output_file_csv CSV or CSV_Stream object 
+    and returns the number of records printed."""
+    printed = 0
+    for record in records: 
+        csv.print_line([str(value) for value in record])
+        printed += 1
+    return printed
+
+
+def hypsometry_to_database (records, database, table, fields = ('GLACIER_ID',) + HYPSOMETRY_FIELDS, 
+                            batch_size = 1000):
+    """Inserts hypsometry records into a table using a Database_Connection and
+    returns the number of records inserted. 'fields' are the table columns in
+    record order. Records are inserted in batches of 'batch_size' rows."""
+    return database.insert_records(table, records, fields, batch_size)['rows']
+
+
+def _bin_values (dem, mask, bin_size, nodata):
+    """Returns the cells of the DEM to bin (as a boolean array), their values and 
+    their bin numbers. Cells are used if they are in the mask, are not nodata and 
+    fall in the 0 - 8850 m range used by 'bin_by_dem'."""
+    min_bin = 0 # Force default min_bin to sea level. DO NOT CHANGE. 
+    max_bin = 8850
+    total_bins = int(math.ceil(float(max_bin - min_bin) / float(bin_size)))
+    
+    dem = numpy.asarray(dem, dtype = float)
+    valid = numpy.isfinite(dem) & (dem >= min_bin) & (dem <= max_bin)
+    if nodata is not None: valid &= (dem != nodata)
+    if mask is not None: valid &= numpy.asarray(mask, dtype = bool)
+    values = dem[valid]
+    
+    bins = numpy.minimum(((values - min_bin) // bin_size).astype(numpy.int64), total_bins - 1)
+    return valid, values, bins
+
+
+def _group_statistics (keys, values):
+    """Returns the unique keys along with the count, sum, minimum and maximum of
+    the values for each key. Values are grouped by sorting on key so all of the
+    statistics are found in a single pass."""
+    order = numpy.argsort(keys, kind = 'mergesort')
+    keys, values = keys[order], values[order]
+    
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(keys)) + 1))
+    counts = numpy.diff(numpy.concatenate((starts, [values.size])))
+    return (keys[starts], counts, numpy.add.reduceat(values, starts), 
+            numpy.minimum.reduceat(values, starts), numpy.maximum.reduceat(values, starts))
+
+
 
 def get_properties (raster, prop = ''):
     """Return the desired property from the input raster layer. These include:
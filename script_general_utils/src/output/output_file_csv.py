@@ -19,6 +19,7 @@ License: Although this application has been produced and tested
  be held liable for improper or incorrect use of the utility described and/
  or contained herein.
 ****************************************************************************"""
+import time
 
 class CSV (object):
     """csv is used to create, update and print information to a csv file.
@@ -86,6 +87,98 @@ class CSV (object):
         except:
             return "COULD NOT PRINT TO CSV"
 
+
+class CSV_Stream (object):
+    """CSV_Stream is used to create and print information to a csv file without
+    holding its content in memory. Unlike 'CSV', which rewrites the whole file
+    every time a line is printed, rows are appended to a single open file handle
+    and flushed to disk in batches. Because no rows are kept, 'get_records' is
+    not available. Use 'CSV' if the records are needed after printing.
+    Attributes:
+    csv Name (optional): A String for the name of the csv file.
+    headers (optional): A list of headers to populate the csv file.
+    flush_rows (optional): Number of rows to buffer before flushing to disk.
+    flush_seconds (optional): Maximum number of seconds between flushes."""
+    
+    # Create the csv file (.csv file) and populate the first line with headers.
+    def __init__ (self, output, csv_name = 'csv', headers = [], flush_rows = 1000, flush_seconds = None):
+        """init creates the csv '.csv' file, leaves it open for appending and
+        populates it with the header."""
+        
+        # initialize instance variables
+        self.__csvfile = output + '\\' + csv_name + '.csv'
+        self.__header = headers # The header of the csv file.
+        self.__records = 0
+        self.__pending = 0 # Rows written since the last flush
+        self.__flush_rows = flush_rows
+        self.__flush_seconds = flush_seconds
+        self.__last_flush = time.time()
+        
+        self.__output_file = open (self.__csvfile, 'w') # Open CSV hard copy
+        for item in self.__header: # Print the header to the CSV.
+            self.__output_file.write(item + ',')
+        self.__output_file.write('\n') # Move cursor to next line
+        
+        
+    def __enter__ (self):
+        """Allows the csv to be used in a 'with' statement."""
+        return self
+    
+    
+    def __exit__ (self, exc_type, exc_value, traceback):
+        """Close the csv when leaving a 'with' statement."""
+        self.close()
+        return False
+        
+#______________________________________________________________________________
+#***Methods********************************************************************
+    def get_header (self):
+        """Return the csv header as a list."""
+        return self.__header
+    
+    
+    def get_name (self):
+        """Return the csv path and name."""
+        return self.__csvfile
+    
+    
+    def get_rows (self):
+        """Return the number of records in the csv."""
+        return self.__records
+    
+    
+    def print_line (self, row_list):
+        """Appends a line to the csv file. The line is written to disk once
+        'flush_rows' lines are waiting or 'flush_seconds' have passed."""
+        try:
+            # Build the whole line first so a bad item does not leave part of a row
+            line = ''.join([each_item + ',' for each_item in row_list]) + '\n'
+            self.__output_file.write(line)
+            self.__records += 1 # Increase the Record Count by 1
+            self.__pending += 1
+            
+            # Flush if the batch is full or the timer has run out.
+            if self.__flush_rows and self.__pending >= self.__flush_rows: self.flush()
+            elif self.__flush_seconds is not None and \
+                time.time() - self.__last_flush >= self.__flush_seconds: self.flush()
+            return "PRINTED TO CSV"
+        except:
+            return "COULD NOT PRINT TO CSV"
+        
+        
+    def flush (self):
+        """Write any buffered rows to the csv file."""
+        self.__output_file.flush()
+        self.__pending = 0
+        self.__last_flush = time.time()
+        
+        
+    def close (self):
+        """Flush and close the csv file. Safe to call more than once."""
+        if not self.__output_file.closed:
+            self.flush()
+            self.__output_file.close()
+
              
 #Driver
 def main():
@@ -18,6 +18,11 @@ License:     Although this application has been produced and tested
  be held liable for improper or incorrect use of the utility described and/
  or contained herein.
 ****************************************************************************"""
+import os
+import time
+import atexit
+import weakref
+import collections
 import utilities.stopwatch as stopwatch
 
 class Log (object):
@@ -75,6 +80,142 @@ class Log (object):
         """Returns the string value of __content."""
         return self.__content
 
+
+class Log_Stream (object):
+    """Log_Stream is used to create, update and print information to a Log file
+    by appending to it rather then reprinting it. Only the most recent lines are
+    held in memory (see 'buffer_lines') so 'get_content' still works for long runs.
+        Attributes:
+            Log Name (optional): A String for the name of the Log file.
+            Application (optional): The name of the application the Log file
+                is reporting on.
+            flush_lines (optional): Flush to disk every n lines. None to disable.
+            flush_seconds (optional): Flush to disk every n seconds. None to disable.
+                With both disabled the Log is only written on close or at exit.
+            buffer_lines (optional): The number of recent lines kept in memory.
+            max_bytes (optional): Rotate the Log file when it exceeds this size.
+                None disables rotation.
+            backup_count (optional): The number of rotated Log files to keep."""
+
+    def __init__ (self, output, log_name = 'Log', app_name = 'Application', flush_lines = 1, 
+                  flush_seconds = None, buffer_lines = 1000, max_bytes = None, backup_count = 5):
+        """init starts the stop watch, creates the Log '.txt' file and populates 
+        it with the current date and time."""
+        self.__clock = stopwatch.StopWatch() # Keeps a reference to the stop watch
+        self.__logfile = output + '\\' + log_name + '.txt' # Assemble Log file path and name
+        self.__title = app_name + ' Log File: ' + '\n' 
+        self.__content = collections.deque(maxlen = buffer_lines) # Most recent lines only
+        
+        self.__flush_lines = flush_lines
+        self.__flush_seconds = flush_seconds
+        self.__max_bytes = max_bytes
+        self.__backup_count = backup_count
+        self.__pending = 0 # Lines written since the last flush
+        self.__last_flush = time.time()
+        
+        self.__log = open (self.__logfile, 'w')
+        self.__log.write(self.__title)
+        # Make sure buffered lines reach the disk. A weak reference so the Log
+        # can still be freed if it is dropped without being closed.
+        atexit.register(_close_at_exit, weakref.ref(self))
+        
+        # Assemble Date and Time for the Log file.
+        content ='Year: ' + str(self.__clock.get_year()) + ' |'
+        content = content + ' Month: ' + str(self.__clock.get_month_name()) + ' |'
+        content = content + ' Day: ' + str(self.__clock.get_day()) + ' |'
+        content = content + ' Started: ' + str(self.__clock.get_time()) + '\n' + '\n'
+
+        self.print_line(content)
+        
+        
+    def __enter__ (self):
+        """Allows the Log to be used in a 'with' statement."""
+        return self
+    
+    
+    def __exit__ (self, exc_type, exc_value, traceback):
+        """Close the Log when leaving a 'with' statement."""
+        self.close()
+        return False
+
+
+    def print_line (self, text, supress_ts = False):
+        """Prints a line to the Log file. supress_ts (time stamp) allows the user 
+        to not include a time stamp. used for adding page breaks"""
+        if supress_ts == False: # No suppression of time stamp.
+            line = str(self.__clock.get_elapsed_time()) + ' - ' + text + '\n'
+        else: # Time stamp suppressed. Used in 'print_break'
+            line = text + '\n'
+        print text
+        
+        self.__content.append(line)
+        if self.__log.closed: return # Closed Log files only keep the buffer
+        self.__log.write(line)
+        self.__pending += 1
+        
+        # Size is checked on every write (tell counts buffered lines) so 'max_bytes'
+        # holds even when the Log is only flushed at exit.
+        if self.__max_bytes and self.__log.tell() >= self.__max_bytes: 
+            self.rotate()
+            self.__pending = 0
+            return
+        
+        # Flush if enough lines are waiting or the timer has run out.
+        if self.__flush_lines and self.__pending >= self.__flush_lines: self.print_to_logfile()
+        elif self.__flush_seconds is not None and \
+            time.time() - self.__last_flush >= self.__flush_seconds: self.print_to_logfile()
+
+
+    def print_to_logfile (self):
+        """Flushes lines waiting in the file buffer to the Log file."""
+        if self.__log.closed: return
+        self.__log.flush()
+        self.__pending = 0
+        self.__last_flush = time.time()
+        
+        
+    def rotate (self):
+        """Closes the current Log file, shifts it and any older Log files up by
+        one (Log.1.txt, Log.2.txt...etc.) and starts a new Log file."""
+        self.__log.close() # Flushes any buffered lines
+        self.__last_flush = time.time()
+        root, ext = os.path.splitext(self.__logfile)
+        for number in range (self.__backup_count - 1, 0, -1): # Oldest first
+            older = '%s.%s%s' %(root, number, ext)
+            if os.path.exists(older):
+                newer = '%s.%s%s' %(root, number + 1, ext)
+                if os.path.exists(newer): os.remove(newer)
+                os.rename(older, newer)
+        if self.__backup_count > 0:
+            first = '%s.1%s' %(root, ext)
+            if os.path.exists(first): os.remove(first)
+            os.rename(self.__logfile, first)
+        self.__log = open (self.__logfile, 'w')
+        self.__log.write(self.__title)
+
+
+    def print_break (self, num_brks = 1):
+        """Prints a line break in the Log file."""
+        for _ in range (0, num_brks): self.print_line('', True)
+        
+        
+    def get_content (self):
+        """Returns the string value of the Log title and the lines held in memory."""
+        return self.__title + ''.join(self.__content)
+    
+    
+    def close (self):
+        """Flush and close the Log file. Safe to call more than once."""
+        if not self.__log.closed:
+            self.__log.flush()
+            self.__log.close()
+
+def _close_at_exit (reference):
+    """Close a Log_Stream at exit if it is still in use."""
+    log = reference()
+    if log is not None: log.close()
+    
+
 #_______________________________________________________________________________
 #***  DRIVER *******************************************************************
 def main():
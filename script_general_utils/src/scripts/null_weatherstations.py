@@ -20,7 +20,7 @@ License:     Although this application has been produced and tested
  be held liable for improper or incorrect use of the utility described and/
  or contained herein.
 ****************************************************************************"""
-import psycopg2 as DBase # PostgreSQL Connection
+from database.database_connection import Database_Connection # PostgreSQL Connection
 from base64 import b64decode as readpassword   
 
 # Database Connection Parameters
@@ -29,8 +29,8 @@ base = r'spatial_database'
 user = r'script'
 word = readpassword(r'c2NyaXB0')
 
-connection  = DBase.connect(" host='%s' dbname='%s' user='%s' password='%s'" %(host, base, user, word))
-cursor = connection.cursor() # Cursor object
+database = Database_Connection(host, base, user, word) # Drawn from the shared pool
+cursor = database.get_cursor() # Cursor object
 
 #Remove negative -9999 from columns and replace it with null 
 cursor.execute("""UPDATE weatherstation_data SET solar_radiation_in = NULL WHERE solar_radiation_in = -9999; """)
@@ -38,4 +38,4 @@ cursor.execute("""UPDATE weatherstation_data SET solar_radiation_out = NULL WHER
 cursor.execute("""UPDATE weatherstation_data SET wind_speed = NULL WHERE wind_speed = -9999;""")
 cursor.execute("""UPDATE weatherstation_data SET wind_direction = NULL WHERE wind_direction = -9999;""")
 
-connection.close() # Close Database Connection
\ No newline at end of file
+database.close() # Return Database Connection to the pool
\ No newline at end of file
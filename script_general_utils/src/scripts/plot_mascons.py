@@ -20,7 +20,7 @@ License:     Although this application has been produced and tested
  or contained herein.
 ****************************************************************************"""
 from base64 import b64decode as readpassword
-import psycopg2 as DBase # PostgreSQL Connection
+from database.database_connection import Database_Connection # PostgreSQL Connection
 
 import matplotlib.pyplot as draw # Plotting operations
 import matplotlib.dates as mdates # Format Plot Date
@@ -55,8 +55,7 @@ regions = {'region1': (1442,1443,1446,1447,1452,1453,1462,1463,1471,1472),
            'region8': (1444,1445,1439,1440,1441,1437,1438,1434,1435)}
 
 # Create database connection
-connection  = DBase.connect(" host='%s' dbname='%s' user='%s' password='%s'" %(host, base, user, word))
-cursor = connection.cursor() # Cursor object
+database = Database_Connection(host, base, user, word) # Drawn from the shared pool
 
 
 """FUNCTIONS---------------------------------------------------------------- """
@@ -65,9 +64,11 @@ cursor = connection.cursor() # Cursor object
 def get_plotdata (queryresults):
     """ Given queary results, create two arrays to serve as x and y datasets for 
     plotting. Generally this should consist of an x array of dates and a y 
-    array of values. This callback returns a tuple containing both new arrays"""
-    x_data = numpy.array([i[0] for i in queryresults if i[1] <> None])
-    y_data = numpy.array([float(i[1]) for i in queryresults if i[1] <> None])
+    array of values. Query results are read once so they can be streamed from
+    a server side cursor. This callback returns a tuple containing both new arrays"""
+    rows = [(i[0], float(i[1])) for i in queryresults if i[1] <> None]
+    x_data = numpy.array([row[0] for row in rows])
+    y_data = numpy.array([row[1] for row in rows])
     return x_data, y_data
 
 
@@ -106,8 +107,8 @@ for region, mascons in regions.iteritems():
     where = where[0:-3] # Remove last or from the where statement
 
     # Get data from database
-    cursor.execute("""SELECT date, SUM(values_filter1d) FROM mascon_solution WHERE %s GROUP BY date ORDER BY date;""" %(where))
-    table_date, table_value = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+    query = """SELECT date, SUM(values_filter1d) FROM mascon_solution WHERE %s GROUP BY date ORDER BY date;""" %(where)
+    table_date, table_value = get_plotdata (database.iter_execute(query)) # Fetch the results and format to arrays
             
     # Setup basic figure parameters
     figure = setup_plot(region, 'Mascon Region %s: cm w.e. vs date' %(region))
@@ -122,4 +123,4 @@ for region, mascons in regions.iteritems():
     figure.savefig(r'%s\%s' %(local_folder, filename))  # Save the plot
     draw.close() # Release the drawing from memory
      
-connection.close() # Close Database Connection
\ No newline at end of file
+database.close() # Return Database Connection to the pool
\ No newline at end of file
@@ -21,7 +21,7 @@ License:     Although this application has been produced and tested
 ****************************************************************************"""
 from datetime import datetime, date, timedelta # Plot Date & Time
 from base64 import b64decode as readpassword               
-import psycopg2 as DBase # PostgreSQL Connection
+from database.database_connection import Concurrent_Database_Connection # PostgreSQL Connection
 
 import paramiko # SSH Connection
 
@@ -62,9 +62,13 @@ process = {'temperature': True,
 # Set the current date and time for use throughout the script
 current_date = date.today()
 
-# Create database connection
-connection  = DBase.connect(" host='%s' dbname='%s' user='%s' password='%s'" %(host, base, user, word))
-cursor = connection.cursor() # Cursor object
+# Columns plotted by each process. Tuples hold the column and station name suffix
+plot_columns = {'temperature': [('air_temperature', ''), ('air_temperature', '_BKP')],
+                'radiation': [('solar_radiation_in', ''), ('solar_radiation_out', '')],
+                'relative_humidity': [('relative_humidity', '')]}
+
+# Create database connection. Queries are run side by side on pooled connections
+database = Concurrent_Database_Connection(host, base, user, word)
 
 
 """------------------------------------------------------------------------- """
@@ -73,12 +77,20 @@ cursor = connection.cursor() # Cursor object
 def get_plotdata (queryresults):
     """ Given queary results, create two arrays to serve as x and y datasets for 
     plotting. Generally this should consist of an x array of dates and a y 
-    array of values. This callback returns a tuple containing both new arrays"""
-    x_data = numpy.array([i[0] for i in queryresults if i[1] <> None])
-    y_data = numpy.array([float(i[1]) for i in queryresults if i[1] <> None])
+    array of values. Query results are read once so they can be streamed from
+    a server side cursor. This callback returns a tuple containing both new arrays"""
+    rows = [(i[0], float(i[1])) for i in queryresults if i[1] <> None]
+    x_data = numpy.array([row[0] for row in rows])
+    y_data = numpy.array([row[1] for row in rows])
     return x_data, y_data
 
 
+def station_query (station, column):
+    """Returns the SQL to select the date and a column for a station over the
+    last 'num_days' days"""
+    return """SELECT date, %s FROM weatherstation_data WHERE station_name = '%s' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(column, station, num_days)
+
+
 def get_statistics (array):
     """Given a one dimensional array of values, this call back returns 
     a dictionary statistics"""
@@ -135,6 +147,16 @@ def post_figure (figure):
         
         
 """------------------------------------------------------------------------- """
+
+
+# Send every query at once so the wait is set by the slowest query, not the sum
+pending = {}
+for plot, columns in plot_columns.iteritems():
+    if process[plot] == True:
+        for station in weather_stations:
+            for column, suffix in columns:
+                query = station_query(station + suffix, column)
+                pending[query] = database.execute(query)
         
         
 if process['temperature'] == True:
@@ -146,12 +168,12 @@ if process['temperature'] == True:
         filename = 'weatherstation_%s_temperature.png' %(station)
         
         # SQL to query Weather Station Information
-        cursor.execute("""SELECT date, air_temperature FROM weatherstation_data WHERE station_name = '%s' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(station, num_days))
-        table_date, table_temp = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+        query = station_query(station, 'air_temperature')
+        table_date, table_temp = get_plotdata (pending[query].get()) # Wait for the results and format to arrays
         
         # SQL to retrieve BACKUP Weather Station Information
-        cursor.execute("""SELECT date, air_temperature FROM weatherstation_data WHERE station_name = '%s_BKP' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(station, num_days))
-        BKP_table_date, BKP_table_temp = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+        query = station_query(station + '_BKP', 'air_temperature')
+        BKP_table_date, BKP_table_temp = get_plotdata (pending[query].get()) # Wait for the results and format to arrays
         
         figure = setup_plot(station, 'Temperature')
     
@@ -201,12 +223,12 @@ if process['radiation'] == True:
         filename = 'weatherstation_%s_radiation.png' %(station)
         
         # SQL to query Weather Station Information      
-        cursor.execute("""SELECT date, solar_radiation_in FROM weatherstation_data WHERE station_name = '%s' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(station, num_days))
-        IN_table_date, IN_table_value = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+        query = station_query(station, 'solar_radiation_in')
+        IN_table_date, IN_table_value = get_plotdata (pending[query].get()) # Wait for the results and format to arrays
 
         # SQL to retrieve BACKUP Weather Station Information  
-        cursor.execute("""SELECT date, solar_radiation_out FROM weatherstation_data WHERE station_name = '%s' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(station, num_days))
-        OUT_table_date, OUT_table_value = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+        query = station_query(station, 'solar_radiation_out')
+        OUT_table_date, OUT_table_value = get_plotdata (pending[query].get()) # Wait for the results and format to arrays
            
         figure = setup_plot(station, 'Solar Radiation')
      
@@ -256,8 +278,8 @@ if process['relative_humidity'] == True:
         filename = 'weatherstation_%s_humidity.png' %(station)
         
         # SQL to query Weather Station Information      
-        cursor.execute("""SELECT date, relative_humidity FROM weatherstation_data WHERE station_name = '%s' AND date > CURRENT_DATE - %s ORDER BY date ASC""" %(station, num_days))
-        table_date, IN_table_value = get_plotdata (cursor.fetchall()) # Fetch the results and format to arrays
+        query = station_query(station, 'relative_humidity')
+        table_date, IN_table_value = get_plotdata (pending[query].get()) # Wait for the results and format to arrays
            
         figure = setup_plot(station, 'Relative Humidity')
      
@@ -285,4 +307,4 @@ if process['relative_humidity'] == True:
 
 
 
-connection.close() # Close Database Connection
\ No newline at end of file
+database.close() # Stop the query workers
\ No newline at end of file
@@ -19,8 +19,113 @@
  be held liable for improper or incorrect use of the utility described and/
  or contained herein.
 -----------------------------------------------------------------------------"""
-import arcpy                                                 #@UnresolvedImport
+import os
+import glob
+import hashlib
+import tempfile
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try: import arcpy                                            #@UnresolvedImport
+except ImportError: arcpy = None # Array backed images can be used without arcpy
 import numpy 
+from numpy.lib.stride_tricks import as_strided
+
+# Focal statistics by name, see '_window_statistic'. The 'nodata' edge mode uses
+# the nan versions so nodata cells are left out of the statistic.
+FOCAL_STATISTICS = dict([(name, lambda windows, name = name: _window_statistic(windows, name, False)) 
+                         for name in ('MEAN', 'MIN', 'MAX', 'STD', 'SUM')])
+FOCAL_NAN_STATISTICS = dict([(name, lambda windows, name = name: _window_statistic(windows, name, True)) 
+                             for name in ('MEAN', 'MIN', 'MAX', 'STD', 'SUM')])
+
+
+class Raster_Metadata (object):
+    """Holds the geo-spatial information for a raster so it only needs to be
+    read once. Location is given by the lower left (left, bottom) corner."""
+    
+    def __init__ (self, rows, columns, x_cell_size, y_cell_size, left, bottom, 
+                  spatial_reference = None, nodata = None, all_nodata = False):
+        """Constructor: stores the raster properties as attributes. 'all_nodata'
+        depends on the cell values so it can be given as a function, which is
+        only called the first time it is needed."""
+        self.rows = rows
+        self.columns = columns
+        self.x_cell_size = x_cell_size
+        self.y_cell_size = y_cell_size
+        self.left = left
+        self.bottom = bottom
+        self.spatial_reference = spatial_reference
+        self.nodata = nodata
+        self._all_nodata = all_nodata
+        
+        
+    @property
+    def all_nodata (self):
+        """True if every cell of the raster is nodata."""
+        if callable(self._all_nodata): self._all_nodata = bool(self._all_nodata())
+        return self._all_nodata
+        
+        
+    def get_shape (self):
+        """Returns the number of rows and columns as a tuple."""
+        return (self.rows, self.columns)
+
+
+
+class Arcpy_Backend (object):
+    """Reads raster metadata and values from a raster dataset using arcpy."""
+    
+    def __init__ (self, filename):
+        """Constructor: takes in a file name (this includes the directory path)"""
+        self._filename = filename
+        
+        
+    def read_metadata (self):
+        """Returns a Raster_Metadata object for the raster dataset."""
+        prop = lambda name: str(arcpy.GetRasterProperties_management(self._filename, name))
+        describe = arcpy.Describe(self._filename)
+        return Raster_Metadata(int(prop('ROWCOUNT')), int(prop('COLUMNCOUNT')),
+                               float(prop('CELLSIZEX')), float(prop('CELLSIZEY')),
+                               float(prop('LEFT')), float(prop('BOTTOM')),
+                               describe.spatialReference,
+                               getattr(describe, 'noDataValue', None),
+                               lambda: prop('ALLNODATA') == '1') # Read when first needed
+    
+    
+    def read_array (self):
+        """Returns the raster values as a numpy array."""
+        return arcpy.RasterToNumPyArray(self._filename)
+
+
+
+class Array_Backend (object):
+    """Serves raster metadata and values from a numpy array and a geotransform
+    so images can be built without arcpy (i.e. for testing). The geotransform 
+    uses the GDAL order: (left, x cell size, 0, top, 0, -y cell size)."""
+    
+    def __init__ (self, array, geotransform, spatial_reference = None, nodata = None):
+        """Constructor: takes in a 2 dimensional numpy array and a geotransform."""
+        self._array = array
+        self._geotransform = geotransform
+        self._spatial_reference = spatial_reference
+        self._nodata = nodata
+        
+        
+    def read_metadata (self):
+        """Returns a Raster_Metadata object for the array."""
+        rows, columns = self._array.shape[0], self._array.shape[1]
+        left, x_size, _, top, _, y_size = self._geotransform
+        if self._nodata is None: all_nodata = False
+        else: all_nodata = lambda: numpy.all(self._array == self._nodata) # Checked when first needed
+        return Raster_Metadata(rows, columns, abs(x_size), abs(y_size), left, 
+                               top - rows * abs(y_size), self._spatial_reference,
+                               self._nodata, all_nodata)
+    
+    
+    def read_array (self):
+        """Returns the numpy array."""
+        return self._array
+
+
 
 class Image (object):
     """Class that deals with layer I/O by holding and storing raster information.
@@ -29,11 +134,27 @@ class Image (object):
     grid cell values or by checking in and out sections of the raster for use in 
     other modules."""
     
-    def __init__ (self, filename):
+    def __init__ (self, filename, backend = None):
         """Imports multiple rasters and holds a reference to them in order to 
         serve as a 3 dimensional array. Takes in a file name (this includes the 
-        directory path)"""      
+        directory path). Raster metadata is read once from the backend, which
+        defaults to reading the file with arcpy."""      
         self._filename = filename
+        if backend is None: backend = Arcpy_Backend(filename)
+        self._backend = backend
+        self.refresh()
+        
+        
+    def refresh (self):
+        """Re-reads the raster metadata from the backend. Only needed if the 
+        raster dataset has been changed on disk."""
+        self._metadata = self._backend.read_metadata()
+        return self._metadata
+    
+    
+    def get_metadata (self):
+        """Returns the cached Raster_Metadata object."""
+        return self._metadata
         
         
     def get_value (self, row, col, band):
@@ -57,40 +178,46 @@ class Image (object):
     def get_location (self):
         """Return the lower left corner coordinates. This is primarily used for saving
         the image or layer to a file."""
+        if arcpy is None: return (self._metadata.left, self._metadata.bottom)
         location = arcpy.Point()
-        location.X = str(arcpy.GetRasterProperties_management(self._filename, "LEFT"))
-        location.Y = str(arcpy.GetRasterProperties_management(self._filename, "BOTTOM"))
+        location.X = self._metadata.left
+        location.Y = self._metadata.bottom
         return location
     
     
     def get_spatailreference (self):
         """Return the spatial reference for the image or layer imported."""
-        return arcpy.Describe(self._filename).spatialReference
+        return self._metadata.spatial_reference
 
 
     def get_rows (self):
         """Returns the number of rows in the image."""
-        return int(str(arcpy.GetRasterProperties_management(self._filename, 'ROWCOUNT')))
+        return self._metadata.rows
 
 
     def get_columns (self):
         """Returns the number of columns in the image"""
-        return int(str(arcpy.GetRasterProperties_management(self._filename, 'COLUMNCOUNT')))
+        return self._metadata.columns
 
 
     def get_x_cell_size (self):
         """Returns the size of image pixels in the X direction"""
-        return arcpy.GetRasterProperties_management(self._filename, 'CELLSIZEX')
+        return self._metadata.x_cell_size
 
 
     def get_y_cell_size (self):
         """Returns the size of image pixels in the y direction"""
-        return arcpy.GetRasterProperties_management(self._filename, 'CELLSIZEY')
+        return self._metadata.y_cell_size
+    
+    
+    def get_nodata (self):
+        """Returns the nodata value of the image or None if it is not set."""
+        return self._metadata.nodata
     
     
     def get_null_raster (self):
         """Return wether or not am image or layer contains all nodata"""
-        return arcpy.GetRasterProperties_management(self._filename, 'ALLNODATA')
+        return self._metadata.all_nodata
 
 
 
@@ -101,11 +228,11 @@ class Single_Image (Image):
     grid cell values or by checking in and out sections of the raster for use in 
     other modules."""
 
-    def __init__(self, filename):
+    def __init__(self, filename, backend = None):
         """Imports a single raster file and returns an array. Takes in a file name
         (this includes the directory path)"""                             
-        self._filename = filename
-        self._layer = arcpy.RasterToNumPyArray(filename)
+        Image.__init__(self, filename, backend)
+        self._layer = self._backend.read_array()
 
 
     def get_value (self, row, column):
@@ -134,26 +261,290 @@ class Single_Image (Image):
         raster.save (output)
 
          
+    def get_window (self, row, column, height, width, halo = 0, copy = False, fill = 0):
+        """Returns a numpy array of the image starting at the given row and column
+        and extending 'height' rows and 'width' columns. 'halo' adds that many extra
+        cells on every side for use with a moving window. If the window is inside
+        the image a view is returned (changes are made to the image directly)
+        unless copy is True. Windows that run off the edge of the image are
+        returned as a copy with the missing cells set to 'fill'."""
+        rows, columns = self._layer.shape[0], self._layer.shape[1]
+        top, left = row - halo, column - halo
+        bottom, right = row + height + halo, column + width + halo
+        
+        # Window is inside the image: slice it without copying
+        if top >= 0 and left >= 0 and bottom <= rows and right <= columns:
+            window = self._layer[top:bottom, left:right]
+            if copy == True: return window.copy()
+            return window
+        
+        # Window is off the edge: build an empty grid and fill in the overlap
+        window = numpy.empty((bottom - top, right - left), dtype = self._layer.dtype)
+        window.fill(fill)
+        r0, r1 = max(top, 0), min(bottom, rows)
+        c0, c1 = max(left, 0), min(right, columns)
+        if r0 < r1 and c0 < c1:
+            window[r0 - top:r1 - top, c0 - left:c1 - left] = self._layer[r0:r1, c0:c1]
+        return window
+    
+    
+    def return_window (self, window, row, column, halo = 0):
+        """Takes in a numpy array returned by 'get_window' and places it back in
+        the image at the given row and column. The halo is not written back and
+        any part of the window that is off the edge of the image is ignored."""
+        rows, columns = self._layer.shape[0], self._layer.shape[1]
+        height = window.shape[0] - 2 * halo
+        width = window.shape[1] - 2 * halo
+        
+        r0, r1 = max(row, 0), min(row + height, rows)
+        c0, c1 = max(column, 0), min(column + width, columns)
+        if r0 < r1 and c0 < c1: # Single slice assignment
+            self._layer[r0:r1, c0:c1] = window[halo + r0 - row:halo + r1 - row, 
+                                               halo + c0 - column:halo + c1 - column]
+
+         
     def get_tile (self, x, width):
         """Returns a numpy array created from the image based on the column X and
-        the size of width."""         
-        xd = x # Tile Width
-        tile = numpy.zeros((self.get_rows() ,width)) # Empty grid to fill
-        for c in range(0, width): # Iterate through array and get values
-            for r in range(0, self.get_rows()):
-                tile[r , c] = self.get_value (r, xd)
-            xd +=1
-        return tile  # Pass grid
+        the size of width."""
+        rows = self._layer.shape[0]
+        return self.get_window(0, x, rows, width).astype(float) # Pass grid
 
 
     def return_tile (self, tile, x, width):
         """Takes in a numpy array and places it in the image based on the
         column X and the size in based on width."""
-        xd = x # Tile Width
-        for c in range(0, width): # Iterate through array and set values
-            for r in range(0, self.get_rows()):
-                self.set_value(r, xd, (tile [r, c]))
-            xd +=1
+        self.return_window(tile[:, 0:width], 0, x)
+        
+        
+    def focal (self, function, size = 3, edge = 'constant', tile_rows = 256):
+        """Runs a moving window of size x size cells over the image and returns a
+        new array of the results. 'function' takes in a 4 dimensional strided view 
+        (rows, columns, size, size) holding the window around each cell and returns
+        a (rows, columns) array. The image is processed 'tile_rows' rows at a time
+        to keep memory use bounded. Edge handling is set by 'edge':
+            constant - cells off the edge are 0 (the same as 'get_value')
+            reflect - the image is mirrored at the edge
+            nodata - cells off the edge and nodata cells are NaN. Cells that
+                are nodata are NaN in the result."""
+        if size % 2 == 0: raise ValueError('Window size must be odd')
+        halo = size // 2
+        rows, columns = self._layer.shape[0], self._layer.shape[1]
+        result = numpy.empty((rows, columns), dtype = float)
+        
+        for r0 in range (0, rows, tile_rows): # For each band of rows...
+            r1 = min(r0 + tile_rows, rows)
+            block = self._padded_block(r0, r1, halo, edge)
+            s0, s1 = block.strides
+            windows = as_strided(block, shape = (r1 - r0, columns, size, size), 
+                                 strides = (s0, s1, s0, s1))
+            result[r0:r1] = function(windows)
+            if edge == 'nodata': 
+                result[r0:r1][numpy.isnan(windows[:, :, halo, halo])] = numpy.nan
+        return result
+    
+    
+    def focal_statistic (self, statistic = 'MEAN', size = 3, edge = 'constant', tile_rows = 256):
+        """Returns the focal statistic (MEAN, MIN, MAX, STD or SUM) of the window
+        around each cell. See 'focal' for edge handling."""
+        if edge == 'nodata': function = FOCAL_NAN_STATISTICS[statistic]
+        else: function = FOCAL_STATISTICS[statistic]
+        return self.focal(function, size, edge, tile_rows)
+    
+    
+    def focal_kernel (self, kernel, edge = 'constant', tile_rows = 256):
+        """Returns the sum of each window multiplied by the kernel, a square numpy 
+        array with an odd number of rows. The kernel is applied as is (not flipped).
+        See 'focal' for edge handling."""
+        kernel = numpy.asarray(kernel, dtype = float)
+        return self.focal(lambda windows: _window_kernel(windows, kernel), kernel.shape[0], edge, tile_rows)
+    
+    
+    def slope (self, edge = 'reflect', tile_rows = 256):
+        """Returns the slope of each cell in degrees using a 3 x 3 window (Horn's 
+        method, as in ArcGIS). See 'focal' for edge handling."""
+        x_size, y_size = float(self.get_x_cell_size()), float(self.get_y_cell_size())
+        def function (windows):
+            dz_dx, dz_dy = _horn_derivatives(windows, x_size, y_size)
+            return numpy.degrees(numpy.arctan(numpy.sqrt(dz_dx ** 2 + dz_dy ** 2)))
+        return self.focal(function, 3, edge, tile_rows)
+    
+    
+    def aspect (self, edge = 'reflect', tile_rows = 256):
+        """Returns the aspect of each cell in compass degrees (0 is north) using a
+        3 x 3 window (Horn's method, as in ArcGIS). Flat cells are -1. See 'focal'
+        for edge handling."""
+        x_size, y_size = float(self.get_x_cell_size()), float(self.get_y_cell_size())
+        def function (windows):
+            dz_dx, dz_dy = _horn_derivatives(windows, x_size, y_size)
+            aspect = numpy.degrees(numpy.arctan2(dz_dy, -dz_dx))
+            aspect = numpy.where(aspect > 90, 450 - aspect, 90 - aspect)
+            return numpy.where((dz_dx == 0) & (dz_dy == 0), -1, aspect)
+        return self.focal(function, 3, edge, tile_rows)
+    
+    
+    def _padded_block (self, r0, r1, halo, edge):
+        """Returns rows r0 to r1 of the image with 'halo' cells on every side, 
+        taken from neighbouring rows where they exist and padded by 'edge'."""
+        rows = self._layer.shape[0]
+        top, bottom = max(r0 - halo, 0), min(r1 + halo, rows)
+        block = self._layer[top:bottom]
+        pad = ((halo - (r0 - top), halo - (bottom - r1)), (halo, halo))
+        
+        if edge == 'constant': return numpy.pad(block, pad, mode = 'constant', constant_values = 0)
+        if edge == 'reflect': return numpy.pad(block, pad, mode = 'reflect')
+        if edge == 'nodata':
+            block = block.astype(float) # Copy so nodata can be set to NaN
+            if self.get_nodata() is not None: block[block == self.get_nodata()] = numpy.nan
+            return numpy.pad(block, pad, mode = 'constant', constant_values = numpy.nan)
+        raise ValueError('Unknown edge mode: %s' %(edge))
+
+
+def _window_statistic (windows, statistic, skip_nan):
+    """Returns the MEAN, MIN, MAX, STD or SUM of each window in a (rows, columns,
+    size, size) view. The statistic is built up one window offset at a time from
+    (rows, columns) slices so memory use does not grow with the window size (a 
+    numpy reduction over the view would copy every window). STD uses running sums
+    of the values and their squares, taken about the center cell for accuracy.
+    NaN cells are left out if skip_nan is set."""
+    size = windows.shape[2]
+    offsets = [(i, j) for i in range (size) for j in range (size)]
+    if statistic in ('MIN', 'MAX'):
+        if skip_nan: reduce = {'MIN': numpy.fmin, 'MAX': numpy.fmax}[statistic] # Ignore NaN
+        else: reduce = {'MIN': numpy.minimum, 'MAX': numpy.maximum}[statistic]
+        result = windows[:, :, 0, 0].astype(float)
+        for i, j in offsets[1:]: reduce(result, windows[:, :, i, j], out = result)
+        return result
+    if statistic not in ('MEAN', 'STD', 'SUM'): raise KeyError(statistic)
+    
+    center = windows[:, :, size // 2, size // 2]
+    total = numpy.zeros(windows.shape[:2])
+    squares = numpy.zeros(windows.shape[:2])
+    count = numpy.zeros(windows.shape[:2]) + len(offsets)
+    for i, j in offsets:
+        if statistic == 'STD': values = numpy.subtract(windows[:, :, i, j], center, dtype = float)
+        else: values = windows[:, :, i, j]
+        if skip_nan:
+            missing = numpy.isnan(values)
+            count -= missing
+            values = numpy.where(missing, 0, values)
+        total += values
+        if statistic == 'STD': squares += values * values
+    if statistic == 'SUM': return total
+    
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'): # All NaN windows are NaN
+        mean = total / count
+        if statistic == 'MEAN': return mean
+        return numpy.sqrt(numpy.maximum(squares / count - mean * mean, 0))
+    
+    
+def _window_kernel (windows, kernel):
+    """Returns the sum of each window in a (rows, columns, size, size) view 
+    multiplied by the kernel, one window offset at a time (see '_window_statistic')."""
+    total = numpy.zeros(windows.shape[:2])
+    for (i, j), weight in numpy.ndenumerate(kernel): total += weight * windows[:, :, i, j]
+    return total
+
+
+def _horn_derivatives (windows, x_size, y_size):
+    """Returns the rate of change in x (east) and y (south, down the rows) for
+    the center of each 3 x 3 window using Horn's method."""
+    a, b, c = windows[:, :, 0, 0], windows[:, :, 0, 1], windows[:, :, 0, 2]
+    d, f = windows[:, :, 1, 0], windows[:, :, 1, 2]
+    g, h, i = windows[:, :, 2, 0], windows[:, :, 2, 1], windows[:, :, 2, 2]
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * x_size)
+    dz_dy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * y_size)
+    return dz_dx, dz_dy
+
+
+def cache_band (file_name, cache_folder = None):
+    """Caches a single band raster to a '.npy' file and returns it opened as a
+    read only memory map. The cache is only rewritten if it is older then the
+    raster. If no cache folder is given the cache is written next to the raster,
+    otherwise the cache name includes a hash of the raster's full path so rasters
+    with the same name in different folders (i.e. 2009/dem.img, 2010/dem.img) 
+    can share a cache folder."""
+    return numpy.load(write_band_cache((file_name, cache_folder)), mmap_mode = 'r')
+
+
+def write_band_cache (arguments):
+    """Writes the '.npy' cache for a (file name, cache folder) tuple if it is 
+    missing or out of date and returns the cache path. Takes a single tuple so
+    it can be used with a worker pool."""
+    file_name, cache_folder = arguments
+    name = os.path.basename(file_name)
+    if cache_folder is None: cache_folder = os.path.dirname(file_name)
+    else: name += '.' + hashlib.md5(os.path.abspath(file_name)).hexdigest()[:12] # Unique per source path
+    cache = os.path.join(cache_folder, name + '.npy')
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(file_name):
+        # Write to a temporary file first so a crash or full disk can not leave
+        # a truncated cache that looks up to date
+        handle, temporary = tempfile.mkstemp(suffix = '.tmp', dir = cache_folder)
+        try:
+            with os.fdopen(handle, 'wb') as output: numpy.save(output, arcpy.RasterToNumPyArray(file_name))
+            if os.path.exists(cache): os.remove(cache) # Windows can not rename over a file
+            os.rename(temporary, cache)
+        except:
+            if os.path.exists(temporary): os.remove(temporary)
+            raise
+    return cache
+
+
+def read_band (file_name):
+    """Returns a single band raster as a numpy array. Kept at module level so it
+    can be used with a process pool."""
+    return arcpy.RasterToNumPyArray(file_name)
+
+
+def get_pool (workers, pool = 'thread'):
+    """Returns a worker pool. 'thread' pools suit I/O and numpy work that 
+    releases the GIL. 'process' pools need functions defined at module level
+    and copy their arguments and results between processes."""
+    if pool == 'process': return multiprocessing.Pool(workers)
+    if pool == 'thread': return ThreadPool(workers)
+    raise ValueError('Unknown pool type: %s' %(pool))
+
+
+class Band_Stack (object):
+    """Acts as a read only 3 dimensional (row, column, band) array built from a
+    list of 2 dimensional bands, such as memory maps, without stacking them.
+    Only the bands and cells that are indexed are read."""
+    
+    def __init__ (self, bands):
+        """Constructor: takes in a list of 2 dimensional arrays of the same shape."""
+        self._bands = bands
+        self.shape = bands[0].shape + (len(bands),)
+        self.dtype = bands[0].dtype
+        self.ndim = 3
+        
+        
+    def __len__ (self):
+        """Returns the number of rows (the same as a numpy array)."""
+        return self.shape[0]
+        
+        
+    def __getitem__ (self, key):
+        """Indexes the stack as [row, column, band]. If band is a single number
+        the band array (or a view of it) is returned, otherwise the selected 
+        bands are stacked along the last axis."""
+        if not isinstance(key, tuple): key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        row, column, band = key
+        
+        if isinstance(band, (int, long, numpy.integer)): return self._bands[band][row, column]
+        if isinstance(band, slice): indices = range(len(self._bands))[band]
+        else: indices = list(band)
+        values = numpy.array([self._bands[index][row, column] for index in indices])
+        return numpy.rollaxis(values, 0, values.ndim)
+    
+    
+    def __array__ (self, dtype = None):
+        """Reads every band and returns the whole stack as a numpy array."""
+        return numpy.asarray(self[:, :, :], dtype = dtype)
+    
+    
+    def get_band (self, band):
+        """Returns a single band."""
+        return self._bands[band]
 
 
 class Folder (Image):
@@ -164,26 +555,109 @@ class Folder (Image):
     other modules. This class differs from 'Image' in that it takes in single band
     files located in a folder to assemble the n-d array."""
     
-    def __init__(self, folder, extention = '*img'):
+    def __init__(self, folder, extention = '*img', memmap = False, cache_folder = None, 
+                 workers = 1, pool = 'thread'):
         """Imports multiple rasters and holds a reference to them in order to 
         serve as a 3 dimensional array. Takes in a folder name (this includes the 
-        directory path)"""      
-        import os
-        import glob
-        
-        arrays = list()
+        directory path). If memmap is True each band is cached once to a '.npy' 
+        file (in 'cache_folder', or next to the raster if not given) and opened 
+        as a memory map so stacks larger then memory can be used. If workers is
+        greater then 1 bands are read by a 'thread' or 'process' pool."""      
         files = [files for files in glob.glob (os.path.join (folder, extention))]
-        for file_name in files: 
-            arrays.append(arcpy.RasterToNumPyArray(file_name))
+        self._files = files
+        if not files: # Other errors (i.e. reading the rasters) are raised
+            print 'ERROR: Folder Maybe Empty.'
+            return
+        
+        Image.__init__(self, files[0])
+        if workers > 1: workpool = get_pool(workers, pool)
+        else: workpool = None
+        
+        try:
+            if memmap == True: 
+                arguments = [(file_name, cache_folder) for file_name in files]
+                if workpool: caches = workpool.map(write_band_cache, arguments)
+                else: caches = [write_band_cache(argument) for argument in arguments]
+                self._array = Band_Stack([numpy.load(cache, mmap_mode = 'r') for cache in caches])
+            else:
+                # Fill a single array band by band rather then stacking copies
+                if workpool: arrays = workpool.imap(read_band, files)
+                else: arrays = (read_band(file_name) for file_name in files)
+                for band, array in enumerate(arrays):
+                    if band == 0: self._array = numpy.empty(array.shape + (len(files),), dtype = array.dtype)
+                    self._array[:, :, band] = array
+                    del array
+        finally:
+            if workpool: 
+                workpool.close()
+                workpool.join()
+        
+        
+    def get_bands (self):
+        """Returns the number of bands in the stack."""
+        return len(self._files)
+    
+    
+    def get_band (self, band):
+        """Returns a single band of the stack as a 2 dimensional array. In
+        memmap mode the band is only read from disk as it is used."""
+        return self._array[:, :, band]
+    
+    
+    def get_window (self, row, column, height, width, bands = None):
+        """Returns a 3 dimensional array of the stack starting at the given row
+        and column and extending 'height' rows and 'width' columns. 'bands' can
+        be a list of band numbers, otherwise all bands are returned. In memmap 
+        mode only the window is read from disk."""
+        if bands is None: bands = slice(None)
+        return self._array[row:row + height, column:column + width, bands]
+    
+    
+    def map_bands (self, function, workers = 1, pool = 'thread'):
+        """Applies function to each band (a 2 dimensional array) and returns a 
+        list of the results in band order. Bands are spread across a 'thread' or
+        'process' pool if workers is greater then 1. Process pools need a function
+        defined at module level and copy each band to the worker."""
+        bands = [self.get_band(band) for band in range (0, self.get_bands())]
+        if workers <= 1: return [function(band) for band in bands]
+        workpool = get_pool(workers, pool)
+        try: return workpool.map(function, bands)
+        finally: 
+            workpool.close()
+            workpool.join()
+            
+            
+    def reduce_bands (self, function, workers = 1, tile_rows = 256):
+        """Combines all bands into a single 2 dimensional array by calling 
+        function(result, band) for each band in turn (i.e. numpy.maximum or 
+        numpy.add). The image is split into tiles of 'tile_rows' rows which are
+        spread across a thread pool if workers is greater then 1."""
+        rows = self.get_rows()
         
-        try: 
-            self._files = files
-            self._filename = files[0]
-            self._array = numpy.dstack(arrays)
-        except: print 'ERROR: Folder Maybe Empty.'
+        def reduce_tile (r0):
+            """Reduce all bands for a single tile of rows."""
+            result = numpy.array(self._array[r0:r0 + tile_rows, :, 0])
+            for band in range (1, self.get_bands()):
+                result = function(result, self._array[r0:r0 + tile_rows, :, band])
+            return r0, result
         
-        del arrays, files
+        if workers > 1: 
+            workpool = ThreadPool(workers)
+            tiles = workpool.imap_unordered(reduce_tile, range (0, rows, tile_rows))
+        else: 
+            workpool = None
+            tiles = (reduce_tile(r0) for r0 in range (0, rows, tile_rows))
         
+        try:
+            output = None
+            for r0, result in tiles: # Place each tile as it finishes
+                if output is None: output = numpy.empty((rows,) + result.shape[1:], dtype = result.dtype)
+                output[r0:r0 + result.shape[0]] = result
+            return output
+        finally:
+            if workpool:
+                workpool.close()
+                workpool.join()
         
         
     def save (self, output, nodata_value = 0):
@@ -0,0 +1,115 @@
+"""****************************************************************************
+ Name:         utilities.spatial_index
+ Purpose:      In memory spatial index used to find which polygon each of a
+     large number of points falls in without a cursor per point.
+
+License:     Although this application has been produced and tested
+ successfully, no warranty expressed or implied is made regarding the
+ reliability and accuracy of the utility, or the data produced by it, on any
+ other system or for general or scientific purposes, nor shall the act of
+ distribution constitute any such warranty. It is also strongly recommended
+ that careful attention be paid to the contents of the metadata / help file
+ associated with these data to evaluate application limitations, restrictions
+ or intended use. The creators and distributors of the application shall not
+ be held liable for improper or incorrect use of the utility described and/
+ or contained herein.
+****************************************************************************"""
+import math
+import numpy
+
+class Polygon_Index (object):
+    """Packed R-tree (Sort-Tile-Recursive) over polygon bounding boxes. Points
+    are located all at once: each tree node passes on only the points inside
+    its bounding box, and at the leaves an exact point in polygon test is run
+    on the points that are left. Polygons are lists of rings (numpy arrays of
+    x, y vertices). Interior rings (holes) are handled by the even-odd rule."""
+
+    def __init__ (self, polygons, node_capacity = 16):
+        """Constructor: builds the tree from a list of polygons."""
+        self._polygons = polygons
+        self._node_capacity = node_capacity
+        boxes = list()
+        for rings in polygons:
+            vertices = numpy.concatenate(rings)
+            boxes.append((vertices[:, 0].min(), vertices[:, 1].min(), vertices[:, 0].max(), vertices[:, 1].max()))
+        self._boxes = numpy.array(boxes, dtype = float).reshape(-1, 4)
+
+        # Leaves hold polygon numbers, each level above holds nodes of the level below
+        nodes = [(box, None, [index]) for index, box in enumerate(self._boxes)]
+        while len(nodes) > 1: nodes = self._pack(nodes)
+        if nodes: self._root = nodes[0]
+        else: self._root = None
+
+
+    def _pack (self, nodes):
+        """Groups nodes into parents of 'node_capacity' children using Sort-Tile-
+        Recursive: sort by x center into vertical slices, then by y center within
+        each slice. Returns the list of parent nodes."""
+        capacity = self._node_capacity
+        slices = int(math.ceil(math.sqrt(math.ceil(len(nodes) / float(capacity)))))
+        per_slice = slices * capacity
+
+        nodes = sorted(nodes, key = lambda node: node[0][0] + node[0][2])
+        parents = list()
+        for start in range (0, len(nodes), per_slice):
+            column = sorted(nodes[start:start + per_slice], key = lambda node: node[0][1] + node[0][3])
+            for first in range (0, len(column), capacity):
+                children = column[first:first + capacity]
+                boxes = numpy.array([child[0] for child in children])
+                box = (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+                parents.append((box, children, None))
+        return parents
+
+
+    def locate (self, x, y):
+        """Returns an array giving the number of the polygon each point falls in,
+        or -1 if it is not in any polygon. If polygons overlap the lowest number
+        (first polygon given) is used."""
+        x, y = numpy.asarray(x, dtype = float), numpy.asarray(y, dtype = float)
+        result = numpy.empty(x.size, dtype = int)
+        result.fill(-1)
+        if self._root is None or x.size == 0: return result
+
+        stack = [(self._root, numpy.arange(x.size))] # Node and the points to test
+        while stack:
+            (box, children, polygons), points = stack.pop()
+            px, py = x[points], y[points]
+            points = points[(px >= box[0]) & (px <= box[2]) & (py >= box[1]) & (py <= box[3])]
+            if points.size == 0: continue
+
+            if children is not None:
+                for child in children: stack.append((child, points))
+                continue
+            for polygon in polygons: # Leaf: exact test
+                inside = points[self.contains(polygon, x[points], y[points])]
+                current = result[inside]
+                result[inside] = numpy.where((current == -1) | (polygon < current), polygon, current)
+        return result
+
+
+    def contains (self, polygon, x, y, chunk = 1000000):
+        """Returns a boolean array, True for each point inside the polygon (even-odd
+        rule). Edges and points are compared all at once in chunks of no more then
+        'chunk' edge / point pairs."""
+        inside = numpy.zeros(x.size, dtype = bool)
+        for ring in self._polygons[polygon]:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = numpy.roll(x1, -1), numpy.roll(y1, -1)
+            step = max(1, chunk // max(1, ring.shape[0]))
+            for start in range (0, x.size, step):
+                px, py = x[start:start + step, None], y[start:start + step, None]
+                crosses = (y1 > py) != (y2 > py)
+                with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+                    at_x = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+                hits = numpy.sum(crosses & (px < at_x), axis = 1)
+                inside[start:start + step] ^= (hits % 2 == 1)
+        return inside
+
+
+
+#_______________________________________________________________________________
+#***  DRIVER *******************************************************************
+def driver ():
+    pass
+if __name__ == '__main__':
+    driver()